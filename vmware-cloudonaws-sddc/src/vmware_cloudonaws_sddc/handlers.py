@@ -2,22 +2,21 @@
 Copyright Amazon.com, Inc. or its affiliates.
 SPDX-License-Identifier: Apache-2.0
 """
-import logging
 import json
-import argparse
-import requests
-from datetime import datetime, timezone
-import time
-import sys
+import math
 import traceback
+from functools import wraps
+from itertools import islice
 from typing import (
     Any,
     Dict,
+    Iterator,
     List,
     Mapping,
     MutableMapping,
     Optional,
     Sequence,
+    Tuple,
 )
 from cloudformation_cli_python_lib import (
     Action,
@@ -26,31 +25,138 @@ from cloudformation_cli_python_lib import (
     ProgressEvent,
     Resource,
     SessionProxy,
-    exceptions,
-    identifier_utils,
 )
+from cloudformation_cli_python_lib.interface import BaseResourceHandlerRequest
+from cloudformation_cli_python_lib.utils import HandlerRequest
 
-from .models import ResourceHandlerRequest, ResourceModel
+from .models import ResourceHandlerRequest, ResourceModel, TypeConfigurationModel
 from .vmc_auth import VMCAuth
-from .vmc_csp import *
-from .vmc_vmc import *
-
-# from .vmc.vmc_auth import VMCAuth
-# from .vmc.vmc_csp import *
+from .vmc_csp import (
+    add_remove_hosts_json,
+    create_sddc_json_v2,
+    delete_sddc_json,
+    get_task_status_v2,
+    watch_sddc_task_json,
+)
+from .vmc_logging import get_logger, set_log_level
+from .vmc_metrics import emit_api_metrics, get_api_metrics, set_metrics_session
+from .vmc_models import install_model_deserializers
+from .vmc_ratelimit import DEFAULT_REQUESTS_PER_SECOND
+from .vmc_session import (
+    Throttled,
+    TimeBudgetExceeded,
+    api_request,
+    get_rate_limiter,
+    remaining_time_budget,
+    set_time_budget,
+)
+from .vmc_vmc import (
+    SDDCRecord,
+    get_sddc_info_json,
+    get_sddcs_json,
+    invalidate_sddc_cache,
+)
 
 # Use this logger to forward log messages to CloudWatch Logs.
-LOG = logging.getLogger(__name__)
+# The level of every logger in the package follows the LogLevel type
+# configuration property (WARNING by default).
+LOG = get_logger(__name__)
 
-LOG.setLevel(logging.WARNING)
-#LOG.setLevel(logging.DEBUG)
+set_log_level()
+# set_log_level("DEBUG")
+
+# Recasting requests into the generated models is done by vmc_models
+install_model_deserializers()
 
 TYPE_NAME = "VMware::CloudOnAWS::SDDC"
 
-resource = Resource(TYPE_NAME, ResourceModel)
+# Seconds of each Lambda invocation kept out of the API time budget, to build
+# and return the ProgressEvent and publish the invocation metrics.
+INVOCATION_RESERVE_SECONDS = 10
+# The part of it that publishing the invocation metrics may use.
+METRICS_RESERVE_SECONDS = 6
+# Delay before a handler that ran out of time is invoked again, and how many
+# times in a row that may happen before the operation fails.
+TIME_BUDGET_RETRY_DELAY_SECONDS = 10
+TIME_BUDGET_MAX_RETRIES = 3
+
+
+def _start_time_budget(context: Any) -> None:
+    """Limit the API calls of this invocation to the time the Lambda context
+    has left, less INVOCATION_RESERVE_SECONDS. Without a Lambda context (a
+    direct call from a local script) API calls are not limited."""
+    get_remaining_time = getattr(context, "get_remaining_time_in_millis", None)
+    if get_remaining_time is None:
+        set_time_budget(None)
+        return
+    set_time_budget(max(0.0, get_remaining_time() / 1000 - INVOCATION_RESERVE_SECONDS))
+
+
+class _TimeBudgetedResource(Resource):
+    """Resource that sets the API time budget of every invocation from its
+    Lambda context; the handlers themselves never see the context.
+
+    It also passes the LIST nextToken on to the handler request, which the
+    library only does for test_entrypoint, and publishes the API metrics
+    through the provider session of the invocation."""
+
+    def _parse_request(self, event_data: MutableMapping[str, Any]):
+        parsed = super()._parse_request(event_data)
+        (_caller_session, provider_session), _action, _callback, _event = parsed
+        set_metrics_session(provider_session)
+        return parsed
+
+    def _cast_resource_request(
+        self, request: HandlerRequest
+    ) -> BaseResourceHandlerRequest:
+        resource_request = super()._cast_resource_request(request)
+        resource_request.nextToken = request.nextToken
+        return resource_request
+
+    def __call__(
+        self, event_data: MutableMapping[str, Any], context: Any
+    ) -> MutableMapping[str, Any]:
+        _start_time_budget(context)
+        try:
+            return super().__call__(event_data, context)
+        finally:
+            set_time_budget(None)
+            set_metrics_session(None)
+
+    def test_entrypoint(
+        self, event: MutableMapping[str, Any], context: Any
+    ) -> ProgressEvent:
+        _start_time_budget(context)
+        try:
+            return super().test_entrypoint(event, context)
+        finally:
+            set_time_budget(None)
+
+
+resource = _TimeBudgetedResource(TYPE_NAME, ResourceModel, TypeConfigurationModel)
 test_entrypoint = resource.test_entrypoint
 
 CALLBACK_DELAY_SECONDS = 30
 
+# Number of SDDCs returned per LIST page
+LIST_PAGE_SIZE = 20
+
+# ResourceModel properties that UPDATE changes in place, mapped to the SDDC
+# document field they are compared with and sent as in the PATCH payload.
+UPDATABLE_PROPERTIES = {
+    "Name": "name",
+}
+
+# Bounds applied to the adaptive callback delay. Both can be overridden through
+# the type configuration (CallbackDelayMinSeconds / CallbackDelayMaxSeconds).
+CALLBACK_DELAY_MIN_SECONDS = 30
+CALLBACK_DELAY_MAX_SECONDS = 300
+# Hard ceiling for callbackDelaySeconds, whatever the type configuration says.
+CALLBACK_DELAY_CAP_SECONDS = 600
+# Fraction of the estimated remaining task time to wait before the next poll.
+# Long waits early in a task, short waits as it nears completion.
+CALLBACK_DELAY_REMAINING_FRACTION = 0.5
+
 # Define a context for the callback logic.  The value for the 'status'
 # key in the dictionary below is consumed in is_callback() and in
 # _callback_helper(), that are invoked from a given handler.
@@ -58,13 +164,128 @@ CALLBACK_STATUS_IN_PROGRESS = {
     "status": OperationStatus.IN_PROGRESS,
 }
 
+# Version of the state carried in the callback context, see
+# _load_callback_context(). Bump it when the meaning of a key changes.
+CALLBACK_CONTEXT_VERSION = 1
+
+
+def _with_api_metrics(action: Action):
+    """Collect the API calls made by one handler invocation and, when
+    EmitApiMetrics is set in the type configuration, publish them to
+    CloudWatch once the handler returns (see emit_api_metrics)."""
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(
+            session: Optional[SessionProxy],
+            request: ResourceHandlerRequest,
+            callback_context: MutableMapping[str, Any],
+        ) -> ProgressEvent:
+            get_api_metrics().reset()
+            try:
+                return handler(session, request, callback_context)
+            finally:
+                type_configuration = request.typeConfiguration
+                if type_configuration and type_configuration.EmitApiMetrics:
+                    remaining = remaining_time_budget()
+                    emit_api_metrics(
+                        {"Action": action.value, "StackId": request.stackId},
+                        time_limit=(
+                            None
+                            if remaining is None
+                            else remaining + METRICS_RESERVE_SECONDS
+                        ),
+                    )
+
+        return wrapper
+
+    return decorator
+
+
+def _retry_when_throttled(handler):
+    """Return an IN_PROGRESS event that invokes the handler again with the
+    same callback context once the delay a 429 answer asked for has passed.
+    The server did nothing, so sending the request again is safe. Used on
+    the handlers that start SDDC operations; the request raising Throttled
+    is the one that would start it, so nothing has been started yet."""
+
+    @wraps(handler)
+    def wrapper(
+        session: Optional[SessionProxy],
+        request: ResourceHandlerRequest,
+        callback_context: MutableMapping[str, Any],
+    ) -> ProgressEvent:
+        try:
+            return handler(session, request, callback_context)
+        except Throttled as e:
+            LOG.warning("Throttled, invoking the handler again: %s", e)
+            delay = CALLBACK_DELAY_SECONDS if e.retry_after is None else e.retry_after
+            return ProgressEvent(
+                status=OperationStatus.IN_PROGRESS,
+                resourceModel=request.desiredResourceState,
+                callbackContext=dict(callback_context),
+                callbackDelaySeconds=min(
+                    CALLBACK_DELAY_CAP_SECONDS, max(1, math.ceil(delay))
+                ),
+            )
+
+    return wrapper
+
+
+def _within_time_budget(action: Action):
+    """Return an IN_PROGRESS event that invokes the handler again with the
+    same callback context when it runs out of time budget, rather than let
+    Lambda cut it off. READ and LIST cannot return IN_PROGRESS and fail with
+    NetworkFailure instead, as does any handler out of time more than
+    TIME_BUDGET_MAX_RETRIES times in a row.
+
+    Handlers let TimeBudgetExceeded through only while invoking them again
+    is safe, i.e. before they have started an SDDC operation."""
+
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(
+            session: Optional[SessionProxy],
+            request: ResourceHandlerRequest,
+            callback_context: MutableMapping[str, Any],
+        ) -> ProgressEvent:
+            try:
+                return handler(session, request, callback_context)
+            except TimeBudgetExceeded as e:
+                LOG.warning("%s handler ran out of time: %s", action.value, e)
+                retries = callback_context.get("time_budget_retries", 0)
+                if (
+                    action in (Action.READ, Action.LIST)
+                    or retries >= TIME_BUDGET_MAX_RETRIES
+                ):
+                    return _progress_event_failed(
+                        handler_error_code=HandlerErrorCode.NetworkFailure,
+                        error_message=f"VMware Cloud on AWS API too slow: {e}",
+                    )
+                next_context = dict(callback_context)
+                next_context["time_budget_retries"] = retries + 1
+                return ProgressEvent(
+                    status=OperationStatus.IN_PROGRESS,
+                    resourceModel=request.desiredResourceState,
+                    callbackContext=next_context,
+                    callbackDelaySeconds=TIME_BUDGET_RETRY_DELAY_SECONDS,
+                )
+
+        return wrapper
+
+    return decorator
+
 
 @resource.handler(Action.CREATE)
+@_with_api_metrics(Action.CREATE)
+@_within_time_budget(Action.CREATE)
+@_retry_when_throttled
 def create_handler(
     session: Optional[SessionProxy],
     request: ResourceHandlerRequest,
     callback_context: MutableMapping[str, Any],
 ) -> ProgressEvent:
+    _apply_type_configuration(request.typeConfiguration)
     model = request.desiredResourceState
     progress: ProgressEvent = ProgressEvent(
         status=OperationStatus.IN_PROGRESS,
@@ -86,7 +307,7 @@ def create_handler(
         authentication = VMCAuth(model.CSPProdURL)
         authentication.getAccessToken(model.AccessToken)
         if authentication.access_token is None:
-            LOG.debug(f"VMCAuth failed. Model: {model}")
+            LOG.debug("VMCAuth failed. Model: %s", model)
             return ProgressEvent.failed(
                 HandlerErrorCode.InvalidCredentials,
                 "Authentication to VMC was unsuccessful, unable to continue.",
@@ -114,15 +335,35 @@ def create_handler(
             task_id = json_response["id"]
             model.ID = sddcId
             model.TaskID = task_id
-            LOG.debug(f"Model name and subnet: {model.Name}, {model.ManagementSubnet}")
+            LOG.debug(
+                "Model name and subnet: %s, %s", model.Name, model.ManagementSubnet
+            )
 
             # wait_for_task_v2(strProdUrl, authentication, orgId, sddcId, task_id)
-            task_complete = check_task_status_v2(
-                model.ProdURL, authentication, model.OrgID, sddcId, task_id
-            )
+            # The SDDC is being created from here on, so running out of time
+            # only leaves the first poll to the callback.
+            try:
+                task_status = get_task_status_v2(
+                    model.ProdURL,
+                    authentication,
+                    model.OrgID,
+                    sddcId,
+                    task_id,
+                    retrieve_progress=True,
+                )
+            except TimeBudgetExceeded as e:
+                LOG.warning("Skipping the first task poll: %s", e)
+                task_status = {}
+            next_context = _load_callback_context({})
+            _record_task_status(next_context, task_status)
 
             return _progress_event_callback(
                 model=model,
+                callback_delay_seconds=_callback_delay_seconds(
+                    request.typeConfiguration,
+                    task_status.get("estimated_remaining_minutes"),
+                ),
+                callback_context=next_context,
             )
 
         else:
@@ -133,26 +374,32 @@ def create_handler(
                 None,
             )
 
+    except (TimeBudgetExceeded, Throttled):
+        raise
     except Exception as e:
         # exceptions module lets CloudFormation know the type of failure that occurred
-        LOG.debug(f"Exception: {e}")
+        LOG.debug("Exception: %s", e)
         return ProgressEvent.failed(HandlerErrorCode.InternalFailure, e, None)
 
 
 @resource.handler(Action.UPDATE)
+@_with_api_metrics(Action.UPDATE)
+@_within_time_budget(Action.UPDATE)
+@_retry_when_throttled
 def update_handler(
     session: Optional[SessionProxy],
     request: ResourceHandlerRequest,
     callback_context: MutableMapping[str, Any],
 ) -> ProgressEvent:
+    _apply_type_configuration(request.typeConfiguration)
     model = request.desiredResourceState
     progress: ProgressEvent = ProgressEvent(
         status=OperationStatus.IN_PROGRESS,
         resourceModel=model,
     )
-    LOG.debug(f"update_handler(), attempting to print model: {model}")
+    LOG.debug("update_handler(), attempting to print model: %s", model)
 
-    LOG.debug(f"Progress status: {progress.status}")
+    LOG.debug("Progress status: %s", progress.status)
 
     if _is_callback(
         callback_context,
@@ -169,8 +416,14 @@ def update_handler(
             authentication = VMCAuth(model.CSPProdURL)
             authentication.getAccessToken(model.AccessToken)
             LOG.debug("About to invoke get_sddc_info_json()")
+            # What UPDATE writes is decided from the live document, never a
+            # cached one
             sddc = get_sddc_info_json(
-                model.ProdURL, model.OrgID, authentication.access_token, model.ID
+                model.ProdURL,
+                model.OrgID,
+                authentication.access_token,
+                model.ID,
+                use_cache=False,
             )
             if sddc is None:
                 return _progress_event_failed(
@@ -178,7 +431,7 @@ def update_handler(
                     error_message="update_handler: Could not retrieve SDDC",
                 )
             else:
-                LOG.debug(f"SDDC State: {sddc['sddc_state']}")
+                LOG.debug("SDDC State: %s", sddc["sddc_state"])
                 # SDDCs are never actually deleted, just hidden from the CSP UI. They can be found via API
                 # If the SDDC is found, but in a state of 'DELETED', return the Not Found error code
                 if sddc["sddc_state"] == "DELETED":
@@ -192,25 +445,83 @@ def update_handler(
                 error_message="update_handler: no model ID was found",
             )
 
+    except (TimeBudgetExceeded, Throttled):
+        raise
     except Exception as e:
-        LOG.debug(f"Exception {e}")
+        LOG.debug("Exception %s", e)
         return _progress_event_failed(
             handler_error_code=HandlerErrorCode.NotFound,
             error_message=str(e),
             traceback_content=traceback.format_exc(),
         )
 
-    try:
-        success = _update_sddc_helper(
-            authentication=authentication, model=model, request=request, sddc=sddc
+    payload, compared, requested = _diff_sddc(
+        model, request.previousResourceState, sddc
+    )
+    if model.NumHosts is not None:
+        compared.append("NumHosts")
+    host_delta = _host_count_delta(model, request.previousResourceState, sddc)
+    LOG.debug(
+        "update_handler: compared %s, requested %s, changed %s, host delta %s",
+        compared,
+        requested,
+        list(payload),
+        host_delta,
+    )
+    if not payload and not host_delta:
+        return _progress_event_success(
+            model=model,
+            message=f"No changes to apply. Compared: {', '.join(compared)}",
         )
-        print(f"Update sddc helper succeeded? {success}")
-        if not success:
-            return _progress_event_failed(
-                handler_error_code=HandlerErrorCode.InternalFailure,
-                error_message="Failed to update SDDC",
+
+    changed = [
+        property_name
+        for property_name, sddc_field in UPDATABLE_PROPERTIES.items()
+        if sddc_field in payload
+    ]
+    try:
+        if payload:
+            success = _update_sddc_helper(
+                authentication=authentication,
+                model=model,
+                request=request,
+                sddc=sddc,
+                payload=payload,
+            )
+            LOG.debug("Update sddc helper succeeded? %s", success)
+            if not success:
+                return _progress_event_failed(
+                    handler_error_code=HandlerErrorCode.InternalFailure,
+                    error_message="Failed to update SDDC",
+                )
+
+        if host_delta:
+            action = "add" if host_delta > 0 else "remove"
+            cluster = _primary_cluster(sddc) or {}
+            json_response = add_remove_hosts_json(
+                model.ProdURL,
+                authentication,
+                model.OrgID,
+                model.ID,
+                abs(host_delta),
+                action,
+                cluster_id=cluster.get("cluster_id"),
+            )
+            if not json_response or "id" not in json_response:
+                return _progress_event_failed(
+                    handler_error_code=HandlerErrorCode.InternalFailure,
+                    error_message=f"Failed to {action} {abs(host_delta)} host(s)",
+                )
+            LOG.debug("ESX %s task ID: %s", action, json_response["id"])
+            next_context = _load_callback_context({})
+            next_context["update_task_id"] = json_response["id"]
+            return _progress_event_callback(
+                model=model,
+                callback_context=next_context,
             )
 
+    except (TimeBudgetExceeded, Throttled):
+        raise
     except Exception as e:
         return _progress_event_failed(
             handler_error_code=HandlerErrorCode.InternalFailure,
@@ -220,15 +531,20 @@ def update_handler(
 
     return _progress_event_success(
         model=model,
+        message=f"Updated: {', '.join(changed)}. Compared: {', '.join(compared)}",
     )
 
 
 @resource.handler(Action.DELETE)
+@_with_api_metrics(Action.DELETE)
+@_within_time_budget(Action.DELETE)
+@_retry_when_throttled
 def delete_handler(
     session: Optional[SessionProxy],
     request: ResourceHandlerRequest,
     callback_context: MutableMapping[str, Any],
 ) -> ProgressEvent:
+    _apply_type_configuration(request.typeConfiguration)
     model = request.desiredResourceState
     progress: ProgressEvent = ProgressEvent(
         status=OperationStatus.IN_PROGRESS,
@@ -248,7 +564,7 @@ def delete_handler(
     authentication = VMCAuth(model.CSPProdURL)
     authentication.getAccessToken(model.AccessToken)
     if authentication.access_token is None:
-        LOG.debug(f"VMCAuth failed. Model: {model}")
+        LOG.debug("VMCAuth failed. Model: %s", model)
         return ProgressEvent.failed(
             HandlerErrorCode.InvalidCredentials,
             "Authentication to VMC was unsuccessful, unable to continue.",
@@ -256,13 +572,13 @@ def delete_handler(
         )
     if model:
         if model.ID:
-            print(f"SDDC ID to Delete: [{model.ID}]")
+            LOG.info("SDDC ID to Delete: [%s]", model.ID)
             json_response = delete_sddc_json(
                 model.ProdURL, authentication, model.OrgID, model.ID, False
             )
             if json_response:
                 id = json_response["id"]
-                LOG.debug(f"Delete task ID: {id}")
+                LOG.debug("Delete task ID: %s", id)
                 model.DeleteTaskID = id
 
                 return _progress_event_callback(
@@ -271,7 +587,7 @@ def delete_handler(
 
             else:
                 LOG.debug("No id found in response from delete_sddc_json()")
-                LOG.debug(f"json: {json_response}")
+                LOG.debug("json: %s", json_response)
                 return ProgressEvent.failed(
                     HandlerErrorCode.NotFound,
                     "No id found in response from delete_sddc_json()",
@@ -289,20 +605,23 @@ def delete_handler(
 
 
 @resource.handler(Action.READ)
+@_with_api_metrics(Action.READ)
+@_within_time_budget(Action.READ)
 def read_handler(
     session: Optional[SessionProxy],
     request: ResourceHandlerRequest,
     callback_context: MutableMapping[str, Any],
 ) -> ProgressEvent:
+    _apply_type_configuration(request.typeConfiguration)
     model = request.desiredResourceState
     progress: ProgressEvent = ProgressEvent(
         status=OperationStatus.IN_PROGRESS,
         resourceModel=model,
     )
 
-    LOG.debug(f"read_handler(), attempting to print model: {model}")
+    LOG.debug("read_handler(), attempting to print model: %s", model)
 
-    LOG.debug(f"Progress status: {progress.status}")
+    LOG.debug("Progress status: %s", progress.status)
 
     try:
         if model and model.ID:
@@ -318,7 +637,7 @@ def read_handler(
                     error_message="read_handler: Could not retrieve SDDC",
                 )
             else:
-                LOG.debug(f"SDDC State: {sddc['sddc_state']}")
+                LOG.debug("SDDC State: %s", sddc["sddc_state"])
                 # SDDCs are never actually deleted, just hidden from the CSP UI. They can be found via API
                 # If the SDDC is found, but in a state of 'DELETED', return the Not Found error code
                 if sddc["sddc_state"] == "DELETED":
@@ -332,8 +651,10 @@ def read_handler(
                 error_message="read_handler: no model ID was found",
             )
 
+    except (TimeBudgetExceeded, Throttled):
+        raise
     except Exception as e:
-        LOG.debug(f"Exception {e}")
+        LOG.debug("Exception %s", e)
         return _progress_event_failed(
             handler_error_code=HandlerErrorCode.NotFound,
             error_message=str(e),
@@ -346,25 +667,37 @@ def read_handler(
 
 
 @resource.handler(Action.LIST)
+@_with_api_metrics(Action.LIST)
+@_within_time_budget(Action.LIST)
 def list_handler(
     session: Optional[SessionProxy],
     request: ResourceHandlerRequest,
     callback_context: MutableMapping[str, Any],
 ) -> ProgressEvent:
+    _apply_type_configuration(request.typeConfiguration)
     progress: ProgressEvent = ProgressEvent(
         status=OperationStatus.IN_PROGRESS,
         resourceModel=None,
     )
 
-    LOG.debug(f"list_handler progress status: {progress.status}")
+    LOG.debug("list_handler progress status: %s", progress.status)
 
     try:
-        resource_model_list = []
         model = request.desiredResourceState
-        LOG.debug(f"model: {model}")
-        resource_model_list = _get_resource_model_list(model)
-        LOG.debug(f"model list: {resource_model_list}")
+        LOG.debug("model: %s", model)
+        resource_model_list, next_token, skipped = _get_resource_model_list(
+            model, request.nextToken
+        )
+        LOG.debug("model list: %s, next token: %s", resource_model_list, next_token)
 
+    except ValueError as e:
+        return _progress_event_failed(
+            handler_error_code=HandlerErrorCode.InvalidRequest,
+            error_message=str(e),
+            traceback_content=traceback.format_exc(),
+        )
+    except (TimeBudgetExceeded, Throttled):
+        raise
     except Exception as e:
         return _progress_event_failed(
             handler_error_code=HandlerErrorCode.InternalFailure,
@@ -372,74 +705,213 @@ def list_handler(
             traceback_content=traceback.format_exc(),
         )
 
+    message = ""
+    if skipped:
+        message = f"Skipped {len(skipped)} SDDC(s) that could not be listed: " + (
+            ", ".join(f"{entry['id']} ({entry['reason']})" for entry in skipped)
+        )
+
     return _progress_event_success(
         models=resource_model_list,
         is_list_handler=True,
+        next_token=next_token,
+        message=message,
     )
 
 
+def _iter_sddc_records(
+    sddc_list: Sequence[Mapping[str, Any]],
+    offset: int = 0,
+    skipped: Optional[List[Dict[str, str]]] = None,
+) -> Iterator[Tuple[int, SDDCRecord]]:
+    """Lazily project SDDC documents, starting at offset, onto SDDCRecords.
+
+    Yields (position in sddc_list, record). DELETED SDDCs and documents that
+    lack a field LIST reports are passed over; the latter are appended to
+    skipped with the reason.
+    """
+    for position, sddc in enumerate(islice(sddc_list, offset, None), start=offset):
+        if sddc.get("sddc_state") == "DELETED":
+            continue
+        try:
+            record = SDDCRecord.from_json(sddc)
+        except (KeyError, TypeError) as e:
+            reason = f"missing {e}" if isinstance(e, KeyError) else str(e)
+            LOG.warning("Skipping SDDC %s in LIST: %s", sddc.get("id"), reason)
+            if skipped is not None:
+                skipped.append({"id": str(sddc.get("id")), "reason": reason})
+            continue
+        yield position, record
+
+
+class _ListedSDDC:
+    """An SDDC on a LIST page. Holds the SDDCRecord and the request model it
+    shares with the rest of the page; the ResourceModel is only built when
+    the ProgressEvent is serialized."""
+
+    __slots__ = ("record", "model")
+
+    def __init__(self, record: SDDCRecord, model: ResourceModel):
+        self.record = record
+        self.model = model
+
+    def __repr__(self) -> str:
+        return f"_ListedSDDC({self.record!r})"
+
+    def to_resource_model(self) -> ResourceModel:
+        record = self.record
+        return ResourceModel(
+            AccessToken=self.model.AccessToken,
+            ID=record.id,
+            Name=record.name,
+            OrgID=record.org_id,
+            DeploymentType=None,
+            ManagementSubnet=record.vpc_cidr,
+            VXLANSubnet=None,
+            Region=record.region,
+            HostType=None,
+            NumHosts=None,
+            Provider=record.provider,
+            ConnectedAWSAccountID=None,
+            ConnectedAWSSubnetID=None,
+            ConnectedAWSVPC=None,
+            ProdURL=self.model.ProdURL,
+            CSPProdURL=self.model.CSPProdURL,
+            TaskID=None,
+            DeleteTaskID=None,
+            vCenterURL=record.vc_url,
+            NSXPublicURL=record.nsx_reverse_proxy_url,
+        )
+
+    def _serialize(self) -> Mapping[str, Any]:
+        # Called by ProgressEvent._serialize for each of its resourceModels
+        return self.to_resource_model()._serialize()
+
+
 def _get_resource_model_list(
     model: ResourceModel,
-) -> List[ResourceModel]:
+    next_token: Optional[str] = None,
+    page_size: int = LIST_PAGE_SIZE,
+) -> Tuple[List[_ListedSDDC], Optional[str], List[Dict[str, str]]]:
+    """Return one page of SDDCs, the token for the next page and the SDDCs
+    skipped while building the page.
+
+    The token is the position of the first SDDC not yet returned; only the
+    SDDCs on the requested page are projected, and they become ResourceModels
+    when the ProgressEvent is serialized.
+    """
     LOG.debug("_get_resource_model_list()")
-    resource_model_list = []
+
+    offset = 0
+    if next_token:
+        if not next_token.isdigit():
+            raise ValueError(f"Invalid nextToken: {next_token}")
+        offset = int(next_token)
 
     authentication = VMCAuth(model.CSPProdURL)
     authentication.getAccessToken(model.AccessToken)
-    LOG.debug(f"_get_resource_model_list token: {authentication.access_token}")
-    LOG.debug(f"_get_resource_model_list model: {model}")
+    LOG.debug("_get_resource_model_list model: %s", model)
     sddc_list = get_sddcs_json(model.ProdURL, model.OrgID, authentication.access_token)
+    if sddc_list is None:
+        raise RuntimeError("Could not retrieve the list of SDDCs")
 
-    LOG.debug(f"sddc_list size: {len(sddc_list)}")
-    for sddc in sddc_list:
-        LOG.debug(f"SDDC Name: {sddc['name']}, SDDC ID: {sddc['id']}")
-        try:
-            resource_model_list_item = ResourceModel(
-                AccessToken=model.AccessToken,
-                ID=sddc["id"],
-                Name=sddc["name"],
-                OrgID=sddc["org_id"],
-                DeploymentType=None,
-                ManagementSubnet=sddc["resource_config"]["vpc_info"]["vpc_cidr"],
-                VXLANSubnet=None,
-                Region=sddc["resource_config"]["region"],
-                HostType=None,
-                NumHosts=None,
-                Provider=sddc["provider"],
-                ConnectedAWSAccountID=None,
-                ConnectedAWSSubnetID=None,
-                ConnectedAWSVPC=None,
-                ProdURL=model.ProdURL,
-                CSPProdURL=model.CSPProdURL,
-                TaskID=None,
-                DeleteTaskID=None,
-                vCenterURL=sddc["resource_config"]["vc_url"],
-                NSXPublicURL=sddc["resource_config"]["nsx_reverse_proxy_url"],
-            )
-        except Exception as e:
-            LOG.debug(f"Cannot create ResourceModel object: Exception: {e}")
-            return ProgressEvent.failed(HandlerErrorCode.InternalFailure, e, None)
-
-        resource_model_list.append(resource_model_list_item)
-
-    LOG.debug(f"resource model list: {resource_model_list}")
-    return resource_model_list
+    LOG.debug("sddc_list size: %s", len(sddc_list))
+    page = []
+    skipped = []
+    for position, record in _iter_sddc_records(sddc_list, offset, skipped):
+        if len(page) == page_size:
+            return page, str(position), skipped
+        page.append(_ListedSDDC(record, model))
+    return page, None, skipped
 
 
 def _progress_event_callback(
     model: Optional[ResourceModel],
+    callback_delay_seconds: int = CALLBACK_DELAY_SECONDS,
+    callback_context: Optional[MutableMapping[str, Any]] = None,
 ) -> ProgressEvent:
     """Return a ProgressEvent indicating a callback should occur next."""
     LOG.debug("_progress_event_callback()")
 
+    if callback_context is None:
+        callback_context = _load_callback_context({})
+    callback_context.update(CALLBACK_STATUS_IN_PROGRESS)
+
     return ProgressEvent(
         status=OperationStatus.IN_PROGRESS,
         resourceModel=model,
-        callbackContext=CALLBACK_STATUS_IN_PROGRESS,
-        callbackDelaySeconds=CALLBACK_DELAY_SECONDS,
+        callbackContext=callback_context,
+        callbackDelaySeconds=callback_delay_seconds,
     )
 
 
+def _load_callback_context(
+    callback_context: Mapping[str, Any],
+) -> MutableMapping[str, Any]:
+    """Return the task-resolution state carried between invocations.
+
+    provider_assigned_id: VMC task behind the create operation, resolved
+    once so later polls go to that task first (see get_task_status_v2)
+    update_task_id: VMC task adding or removing hosts during UPDATE
+
+    State written by a different CALLBACK_CONTEXT_VERSION is discarded,
+    except for provider_assigned_id which has kept its meaning.
+    """
+    state = {
+        "version": CALLBACK_CONTEXT_VERSION,
+        "provider_assigned_id": callback_context.get("provider_assigned_id"),
+        "update_task_id": None,
+    }
+    if callback_context.get("version") == CALLBACK_CONTEXT_VERSION:
+        if callback_context.get("update_task_id") is not None:
+            state["update_task_id"] = callback_context["update_task_id"]
+    return state
+
+
+def _record_task_status(
+    callback_context: MutableMapping[str, Any],
+    task_status: Mapping[str, Any],
+) -> None:
+    """Fold the outcome of a task poll into the callback context."""
+    if task_status.get("provider_assigned_id"):
+        callback_context["provider_assigned_id"] = task_status["provider_assigned_id"]
+
+
+def _apply_type_configuration(
+    type_configuration: Optional[TypeConfigurationModel],
+) -> None:
+    """Apply the process-wide settings taken from the type configuration."""
+    requests_per_second = DEFAULT_REQUESTS_PER_SECOND
+    if type_configuration and type_configuration.OrgRequestsPerSecond is not None:
+        requests_per_second = type_configuration.OrgRequestsPerSecond
+    get_rate_limiter().requests_per_second = requests_per_second
+    set_log_level(type_configuration.LogLevel if type_configuration else None)
+
+
+def _callback_delay_seconds(
+    type_configuration: Optional[TypeConfigurationModel],
+    estimated_remaining_minutes: Optional[float] = None,
+) -> int:
+    """Derive the delay before the next callback from the task's estimated
+    remaining time, bounded by the type configuration and the hard cap."""
+    min_delay = CALLBACK_DELAY_MIN_SECONDS
+    max_delay = CALLBACK_DELAY_MAX_SECONDS
+    if type_configuration:
+        if type_configuration.CallbackDelayMinSeconds:
+            min_delay = type_configuration.CallbackDelayMinSeconds
+        if type_configuration.CallbackDelayMaxSeconds:
+            max_delay = type_configuration.CallbackDelayMaxSeconds
+    max_delay = min(max_delay, CALLBACK_DELAY_CAP_SECONDS)
+    min_delay = min(min_delay, max_delay)
+
+    if estimated_remaining_minutes is None:
+        delay = CALLBACK_DELAY_SECONDS
+    else:
+        delay = estimated_remaining_minutes * 60 * CALLBACK_DELAY_REMAINING_FRACTION
+
+    return int(max(min_delay, min(delay, max_delay)))
+
+
 def _is_callback(
     callback_context: MutableMapping[str, Any],
 ) -> bool:
@@ -462,6 +934,8 @@ def _progress_event_success(
     models: Any = None,
     is_delete_handler: bool = False,
     is_list_handler: bool = False,
+    next_token: Optional[str] = None,
+    message: str = "",
 ) -> ProgressEvent:
     LOG.debug("_progress_event_success()")
     LOG.debug(model)
@@ -484,11 +958,14 @@ def _progress_event_success(
         return ProgressEvent(
             status=OperationStatus.SUCCESS,
             resourceModels=models,
+            nextToken=next_token,
+            message=message,
         )
     else:
         return ProgressEvent(
             status=OperationStatus.SUCCESS,
             resourceModel=model,
+            message=message,
         )
 
 
@@ -502,14 +979,75 @@ def _progress_event_failed(
     return ProgressEvent.failed(handler_error_code, error_message)
 
 
+def _diff_sddc(
+    model: ResourceModel,
+    previous_model: Optional[ResourceModel],
+    sddc: Mapping[str, Any],
+) -> Tuple[Dict[str, Any], List[str], List[str]]:
+    """Compare the updatable properties of the desired model with the live SDDC.
+
+    Returns the PATCH payload holding only the SDDC fields whose live value
+    differs from the desired one, the properties compared, and the properties
+    the template changed relative to previousResourceState.
+    """
+    payload = {}
+    compared = []
+    requested = []
+    for property_name, sddc_field in UPDATABLE_PROPERTIES.items():
+        desired = getattr(model, property_name)
+        if desired is None:
+            continue
+        compared.append(property_name)
+        if previous_model is None or getattr(previous_model, property_name) != desired:
+            requested.append(property_name)
+        if sddc.get(sddc_field) != desired:
+            payload[sddc_field] = desired
+    return payload, compared, requested
+
+
+def _primary_cluster(sddc: Mapping[str, Any]) -> Optional[Mapping[str, Any]]:
+    """Return the SDDC's first cluster, the one NumHosts sizes, if listed."""
+    resource_config = sddc.get("resource_config") or {}
+    clusters = resource_config.get("clusters") or []
+    return clusters[0] if clusters else None
+
+
+def _host_count_delta(
+    model: ResourceModel,
+    previous_model: Optional[ResourceModel],
+    sddc: Mapping[str, Any],
+) -> Optional[int]:
+    """Return desired minus live host count of the primary cluster.
+
+    None when NumHosts is unset, unchanged from previousResourceState, or
+    the live count is unknown. Hosts of other clusters are not counted.
+    """
+    if model.NumHosts is None:
+        return None
+    if previous_model is not None and previous_model.NumHosts == model.NumHosts:
+        return None
+    cluster = _primary_cluster(sddc)
+    if cluster is not None:
+        esx_hosts = cluster.get("esx_host_list")
+    else:
+        # SDDCs listed without clusters have a single one
+        esx_hosts = (sddc.get("resource_config") or {}).get("esx_hosts")
+    if esx_hosts is None:
+        return None
+    return int(model.NumHosts) - len(esx_hosts)
+
+
 def _update_sddc_helper(
     authentication: VMCAuth,
     model: ResourceModel,
     request: ResourceHandlerRequest,
     sddc: str,
+    payload: Optional[Dict[str, Any]] = None,
 ) -> bool:
     LOG.debug(
-        f"_update_sddc_helper(): Requested name: {model.Name}, SDDC current name: {sddc['name']}"
+        "_update_sddc_helper(): Requested name: %s, SDDC current name: %s",
+        model.Name,
+        sddc["name"],
     )
 
     myHeader = {
@@ -524,21 +1062,35 @@ def _update_sddc_helper(
         + "/sddcs/"
         + sddc["resource_config"]["sddc_id"]
     )
-    LOG.debug(f"API URL: {myURL}")
+    LOG.debug("API URL: %s", myURL)
 
-    payload = {"name": model.Name}
+    if payload is None:
+        payload = {"name": model.Name}
 
     json_data = json.dumps(payload)
-    response = requests.patch(myURL, headers=myHeader, data=json_data, timeout=20)
+    invalidate_sddc_cache(model.ProdURL, model.OrgID, model.ID)
+    response = api_request("PATCH", myURL, headers=myHeader, data=json_data, timeout=20)
     if response.status_code == 200:
         return True
     else:
         LOG.debug(
-            f"Could not update SDDC. Response status code: {response.status_code}. Response message: {response.text}. Payload: {json_data}"
+            "Could not update SDDC. Response status code: %s. Response message: %s. Payload: %s",
+            response.status_code,
+            response.text,
+            json_data,
         )
         return False
 
 
+def _watch_vmc_task(
+    model: ResourceModel,
+    authentication: VMCAuth,
+    task_id: str,
+) -> Optional[Mapping[str, Any]]:
+    """Fetch a VMC task of the model's org, or None if error."""
+    return watch_sddc_task_json(model.ProdURL, authentication, model.OrgID, task_id)
+
+
 def _callback_helper(
     session: Optional[SessionProxy],
     request: ResourceHandlerRequest,
@@ -550,18 +1102,20 @@ def _callback_helper(
     """Define a callback logic used for resource stabilization."""
     LOG.debug("_callback_helper()")
 
+    next_context = _load_callback_context(callback_context)
     authentication = VMCAuth(model.CSPProdURL)
     authentication.getAccessToken(model.AccessToken)
     if is_delete_handler:
         LOG.debug(
-            f"delete_handler: OrgID: {model.OrgID}, DeleteTaskID: {model.DeleteTaskID}"
-        )
-        json_response = watch_sddc_task_json(
-            model.ProdURL, authentication, model.OrgID, model.DeleteTaskID
+            "delete_handler: OrgID: %s, DeleteTaskID: %s",
+            model.OrgID,
+            model.DeleteTaskID,
         )
+        json_response = _watch_vmc_task(model, authentication, model.DeleteTaskID)
+        estimated_remaining_minutes = None
         if json_response:
             task_complete = json_response["status"]
-            LOG.debug(f"Delete task status: {task_complete}")
+            LOG.debug("Delete task status: %s", task_complete)
             if task_complete == "FINISHED":
                 LOG.debug("About to return _progress_event_success for DELETE")
                 LOG.debug(model)
@@ -572,18 +1126,68 @@ def _callback_helper(
                     handler_error_code=HandlerErrorCode.NotFound,
                     error_message="callback helper: Task status failed or canceled",
                 )
+            estimated_remaining_minutes = json_response.get(
+                "estimated_remaining_minutes"
+            )
 
-        return _progress_event_callback(model=model)
+        return _progress_event_callback(
+            model=model,
+            callback_delay_seconds=_callback_delay_seconds(
+                request.typeConfiguration, estimated_remaining_minutes
+            ),
+            callback_context=next_context,
+        )
 
     elif is_update_handler:
         LOG.debug("_callback_helper(): UPDATE handler")
-        return _progress_event_success(
+        task_id = next_context.get("update_task_id")
+        if not task_id:
+            return _progress_event_success(
+                model=model,
+            )
+
+        json_response = _watch_vmc_task(model, authentication, task_id)
+        estimated_remaining_minutes = None
+        if json_response:
+            task_complete = json_response["status"]
+            LOG.debug("Update task status: %s", task_complete)
+            if task_complete == "FINISHED":
+                return _progress_event_success(
+                    model=model,
+                    message="Updated: NumHosts",
+                )
+
+            if task_complete == "FAILED" or task_complete == "CANCELED":
+                return _progress_event_failed(
+                    handler_error_code=HandlerErrorCode.InternalFailure,
+                    error_message=(
+                        "callback helper: host update task failed or canceled: "
+                        f"{json_response.get('error_message')}"
+                    ),
+                )
+            estimated_remaining_minutes = json_response.get(
+                "estimated_remaining_minutes"
+            )
+
+        return _progress_event_callback(
             model=model,
+            callback_delay_seconds=_callback_delay_seconds(
+                request.typeConfiguration, estimated_remaining_minutes
+            ),
+            callback_context=next_context,
         )
     else:
-        task_complete = check_task_status_v2(
-            model.ProdURL, authentication, model.OrgID, model.ID, model.TaskID
+        task_status = get_task_status_v2(
+            model.ProdURL,
+            authentication,
+            model.OrgID,
+            model.ID,
+            model.TaskID,
+            retrieve_progress=True,
+            provider_assigned_id=next_context["provider_assigned_id"],
         )
+        _record_task_status(next_context, task_status)
+        task_complete = task_status["status"]
         if task_complete == "READY":
             LOG.debug("About to return _progress_event_success ")
             LOG.debug(model)
@@ -597,4 +1201,10 @@ def _callback_helper(
                 error_message="_callback_helper: Task is a status of failed",
             )
 
-        return _progress_event_callback(model=model)
+        return _progress_event_callback(
+            model=model,
+            callback_delay_seconds=_callback_delay_seconds(
+                request.typeConfiguration, task_status["estimated_remaining_minutes"]
+            ),
+            callback_context=next_context,
+        )
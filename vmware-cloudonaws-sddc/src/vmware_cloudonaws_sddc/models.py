@@ -101,6 +101,11 @@ _ResourceModel = ResourceModel
 
 @dataclass
 class TypeConfigurationModel(BaseModel):
+    CallbackDelayMinSeconds: Optional[int]
+    CallbackDelayMaxSeconds: Optional[int]
+    OrgRequestsPerSecond: Optional[float]
+    LogLevel: Optional[str]
+    EmitApiMetrics: Optional[bool]
 
     @classmethod
     def _deserialize(
@@ -110,10 +115,13 @@ class TypeConfigurationModel(BaseModel):
         if not json_data:
             return None
         return cls(
+            CallbackDelayMinSeconds=json_data.get("CallbackDelayMinSeconds"),
+            CallbackDelayMaxSeconds=json_data.get("CallbackDelayMaxSeconds"),
+            OrgRequestsPerSecond=json_data.get("OrgRequestsPerSecond"),
+            LogLevel=json_data.get("LogLevel"),
+            EmitApiMetrics=json_data.get("EmitApiMetrics"),
         )
 
 
 # work around possible type aliasing issues when variable has same name as a model
 _TypeConfigurationModel = TypeConfigurationModel
-
-
@@ -0,0 +1,129 @@
+## asyncio interface to the VMware Cloud on AWS API helpers
+
+# The coroutines below mirror the blocking helpers of vmc_csp and vmc_vmc and
+# run them on worker threads, so independent requests share the pooled
+# session (vmc_session) and overlap their network waits. Retries, rate
+# limiting, caching and logging are those of the blocking helpers.
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial, wraps
+
+from . import vmc_csp, vmc_vmc
+from .vmc_auth import VMCAuth
+from .vmc_session import POOL_MAXSIZE
+from .vmc_tasks import TaskWatcher
+
+# Requests in flight at once in the fan-out helpers; more would only wait for
+# a pooled connection.
+MAX_CONCURRENT_REQUESTS = POOL_MAXSIZE
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Worker threads for the blocking helpers, started on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix="vmc-api"
+                )
+    return _executor
+
+
+def _run_in_thread(func):
+    """Coroutine function running the blocking func on a worker thread"""
+
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_executor(), partial(func, *args, **kwargs)
+        )
+
+    return wrapper
+
+
+create_sddc_json_v2 = _run_in_thread(vmc_csp.create_sddc_json_v2)
+get_sddc_deployments_json = _run_in_thread(vmc_csp.get_sddc_deployments_json)
+get_sddc_tasks_json = _run_in_thread(vmc_csp.get_sddc_tasks_json)
+get_sddc_task_progress_json = _run_in_thread(vmc_csp.get_sddc_task_progress_json)
+list_org_tasks_json = _run_in_thread(vmc_csp.list_org_tasks_json)
+get_sddc_task_details_json = _run_in_thread(vmc_csp.get_sddc_task_details_json)
+get_task_status_v2 = _run_in_thread(vmc_csp.get_task_status_v2)
+delete_sddc_json = _run_in_thread(vmc_csp.delete_sddc_json)
+add_remove_hosts_json = _run_in_thread(vmc_csp.add_remove_hosts_json)
+watch_sddc_task_json = _run_in_thread(vmc_csp.watch_sddc_task_json)
+get_sddcs_json = _run_in_thread(vmc_vmc.get_sddcs_json)
+get_sddc_info_json = _run_in_thread(vmc_vmc.get_sddc_info_json)
+poll_task_watcher = _run_in_thread(TaskWatcher.poll)
+
+
+async def gather_bounded(*aws, limit: int = MAX_CONCURRENT_REQUESTS) -> list:
+    """asyncio.gather with at most limit awaitables running at once.
+    Results are returned in argument order"""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*(bounded(aw) for aw in aws))
+
+
+async def get_sddcs_info_json(
+    strProdURL, orgID, sessiontoken, sddcIDs, use_cache=True
+) -> dict:
+    """{SDDC ID: SDDC info, or None if error}, fetched concurrently"""
+    results = await gather_bounded(
+        *(
+            get_sddc_info_json(strProdURL, orgID, sessiontoken, sddcID, use_cache)
+            for sddcID in sddcIDs
+        )
+    )
+    return dict(zip(sddcIDs, results))
+
+
+async def watch_sddc_tasks_json(
+    strProdURL, authentication: VMCAuth, orgID, taskIDs
+) -> dict:
+    """{task ID: task, or None if error}, fetched concurrently"""
+    results = await gather_bounded(
+        *(
+            watch_sddc_task_json(strProdURL, authentication, orgID, taskID)
+            for taskID in taskIDs
+        )
+    )
+    return dict(zip(taskIDs, results))
+
+
+async def get_org_overview_json(strProdURL, authentication: VMCAuth, orgID) -> dict:
+    """The org's SDDC list and its deployments, fetched at the same time"""
+    sddcs, deployments = await asyncio.gather(
+        get_sddcs_json(strProdURL, orgID, authentication.access_token),
+        get_sddc_deployments_json(strProdURL, authentication, orgID),
+    )
+    return {"sddcs": sddcs, "deployments": deployments}
+
+
+async def poll_task_watchers(watchers) -> int:
+    """Polls TaskWatchers of different orgs at the same time; returns the
+    number of tasks still pending"""
+    remaining = await gather_bounded(*(poll_task_watcher(w) for w in watchers))
+    return sum(remaining)
+
+
+def run_sync(awaitable):
+    """Runs a coroutine to completion from blocking code, such as the
+    handlers, and returns its result. When the calling thread already runs an
+    event loop, the coroutine runs on a loop of its own in another thread."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(awaitable)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, awaitable).result()
@@ -5,9 +5,85 @@
 ### SPDX-License-Identifier: BSD-2-Clause
 ################################################################################
 
-import json
-import requests
 import datetime
+import hashlib
+import threading
+
+from .vmc_logging import get_logger
+from .vmc_session import IDEMPOTENT_RETRY_POLICY, TimeBudgetExceeded, api_request
+
+LOG = get_logger(__name__)
+
+# Access tokens are cached for the lifetime of the process (a warm Lambda
+# container), keyed by (CSP URL, SHA-256 of the refresh token), so that
+# callbacks and READ/LIST invocations do not re-authorize against CSP.
+_token_cache = {}
+_token_cache_lock = threading.Lock()
+
+# A cached token with less than this many seconds left is refreshed in the
+# background while the current token is still handed out.
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+# A cached token with less than this many seconds left is never handed out.
+TOKEN_EXPIRY_MARGIN_SECONDS = 100
+
+
+def _token_cache_key(strCSPProdURL: str, refresh_token: str) -> tuple:
+    digest = hashlib.sha256(str(refresh_token).encode("utf-8")).hexdigest()
+    return (strCSPProdURL, digest)
+
+
+def clear_token_cache() -> None:
+    """Discard every cached access token"""
+    with _token_cache_lock:
+        _token_cache.clear()
+
+
+def _authorize(strCSPProdURL: str, refresh_token: str) -> tuple:
+    """Exchanges a refresh token for an access token.
+    Returns (access_token, expiration) or (None, None) on error; raises
+    TimeBudgetExceeded when the invocation has no time left for the request"""
+    params = {"api_token": refresh_token}
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+
+    try:
+        # Exchanging the token changes nothing on the CSP side, so it is
+        # retried like a GET
+        response = api_request(
+            "POST",
+            f"{strCSPProdURL}/csp/gateway/am/api/auth/api-tokens/authorize",
+            retry_policy=IDEMPOTENT_RETRY_POLICY,
+            params=params,
+            headers=headers,
+            timeout=20,
+        )
+        jsonResponse = response.json()
+        access_token = jsonResponse["access_token"]
+        expires_in = jsonResponse["expires_in"]
+        expirestime = datetime.datetime.now() + datetime.timedelta(seconds=expires_in)
+        LOG.debug("Token expires at %s", expirestime)
+        return access_token, expirestime
+    except TimeBudgetExceeded:
+        raise
+    except:
+        return None, None
+
+
+def _refresh_cached_token(key: tuple, strCSPProdURL: str, refresh_token: str):
+    """Fetches a new access token and stores it in the cache under key"""
+    access_token = expiration = None
+    try:
+        access_token, expiration = _authorize(strCSPProdURL, refresh_token)
+    finally:
+        with _token_cache_lock:
+            if access_token is not None:
+                _token_cache[key] = {
+                    "access_token": access_token,
+                    "expiration": expiration,
+                    "refreshing": False,
+                }
+            elif key in _token_cache:
+                _token_cache[key]["refreshing"] = False
+    return access_token, expiration
 
 
 class VMCAuth:
@@ -18,35 +94,47 @@ class VMCAuth:
         self.strCSPProdURL = strCSPProdURL
 
     def getAccessToken(self, myRefreshToken):
-        """Gets the Access Token using the Refresh Token"""
+        """Gets the Access Token using the Refresh Token.
+        A live token cached by an earlier call in this process is reused; a
+        token close to expiry is refreshed in the background."""
         self.activeRefreshToken = myRefreshToken
-        params = {"api_token": myRefreshToken}
-        headers = {"Content-Type": "application/x-www-form-urlencoded"}
-
-        try:
-            response = requests.post(
-                f"{self.strCSPProdURL}/csp/gateway/am/api/auth/api-tokens/authorize",
-                params=params,
-                headers=headers,
-                timeout=20,
-            )
-            jsonResponse = response.json()
-            self.access_token = jsonResponse["access_token"]
-            expires_in = jsonResponse["expires_in"]
-            expirestime = datetime.datetime.now() + datetime.timedelta(
-                seconds=expires_in
-            )
-            self.access_token_expiration = expirestime
-            print(f"Token expires at {expirestime}")
-        except:
-            self.access_token = None
-            self.access_token_expiration = None
+        key = _token_cache_key(self.strCSPProdURL, myRefreshToken)
+        now = datetime.datetime.now()
+
+        start_background_refresh = False
+        with _token_cache_lock:
+            entry = _token_cache.get(key)
+            if entry is not None:
+                time_to_expire = (entry["expiration"] - now).total_seconds()
+                if time_to_expire <= TOKEN_EXPIRY_MARGIN_SECONDS:
+                    entry = None
+                elif (
+                    time_to_expire <= TOKEN_REFRESH_MARGIN_SECONDS
+                    and not entry["refreshing"]
+                ):
+                    entry["refreshing"] = True
+                    start_background_refresh = True
+
+        if entry is not None:
+            if start_background_refresh:
+                threading.Thread(
+                    target=_refresh_cached_token,
+                    args=(key, self.strCSPProdURL, myRefreshToken),
+                    daemon=True,
+                ).start()
+            self.access_token = entry["access_token"]
+            self.access_token_expiration = entry["expiration"]
+            return self.access_token
+
+        self.access_token, self.access_token_expiration = _refresh_cached_token(
+            key, self.strCSPProdURL, myRefreshToken
+        )
         return self.access_token
 
     def check_access_token_expiration(self) -> None:
         """Retrieve a new access token if it is near expiration"""
         if self.access_token_expiration is not None:
             time_to_expire = self.access_token_expiration - datetime.datetime.now()
-            if time_to_expire.total_seconds() <= 100:
-                print("Access token expired, attempting to refresh...")
+            if time_to_expire.total_seconds() <= TOKEN_REFRESH_MARGIN_SECONDS:
+                LOG.info("Access token near expiration, attempting to refresh...")
                 self.getAccessToken(self.activeRefreshToken)
@@ -1,12 +1,15 @@
-import ast
-import json
 from .vmc_auth import VMCAuth
 
 # from vmc_auth import VMCAuth
-import requests
+from .vmc_logging import LazyJSON, get_logger
+from .vmc_poll import PollResult, poll_until
+from .vmc_session import api_request, raise_for_throttling
+from .vmc_vmc import invalidate_sddc_cache
 import sys
+import threading
 from datetime import datetime, timezone
-import time
+
+LOG = get_logger(__name__)
 
 
 def create_sddc_json_v2(
@@ -70,11 +73,9 @@ def create_sddc_json_v2(
         }
 
     my_url = f"{strProdURL}/api/inventory/{org_id}/vmc-aws/operations"
-    print(f"Endpoint: {my_url}")
-    print(json.dumps(call_data, indent=4))
-    resp = requests.post(my_url, json=call_data, headers=myHeader, timeout=20)
-
-    print(resp.status_code)
+    LOG.debug("Create SDDC payload: %s", LazyJSON(call_data))
+    resp = api_request("POST", my_url, json=call_data, headers=myHeader, timeout=20)
+    raise_for_throttling(resp)
 
     if resp.status_code != 200:
         try:
@@ -83,43 +84,47 @@ def create_sddc_json_v2(
             json_response = None
 
     if resp.status_code == 201 or resp.status_code == 202 or resp.status_code == 202:
-        print(f"Create SDDC Started. Creation Task is: ")  # pull the task and print it.
-        newTask = json_response["id"]
-        print(f"{newTask}")
+        LOG.info("Create SDDC Started. Creation Task is: %s", json_response["id"])
         return json_response
     elif resp.status_code == 200:
-        print("Create Task Complete: Input Validated")
-        validated = "{'input_validated' : True}"
-        return ast.literal_eval(validated)
+        LOG.info("Create Task Complete: Input Validated")
+        return {"input_validated": True}
     elif resp.status_code == 400:
-        print(f"Error Code {resp.status_code}: Bad Request, Bad URL or Quota Violation")
+        LOG.error(
+            "Error Code %s: Bad Request, Bad URL or Quota Violation", resp.status_code
+        )
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
+            LOG.error("%s", json_response["error_messages"][0])
         return None
     elif resp.status_code == 401:
-        print(
-            f"Error Code {resp.status_code}: You are unauthorized for this operation. See your administrator"
+        LOG.error(
+            "Error Code %s: You are unauthorized for this operation. See your administrator",
+            resp.status_code,
         )
         if "error_messages" in json_response:
-            print(json_response["error_messages"])
+            LOG.error("%s", json_response["error_messages"])
         return None
     elif resp.status_code == 403:
-        print(
-            f"Error Code {resp.status_code}: You are forbidden to use this operation. See your administrator"
+        LOG.error(
+            "Error Code %s: You are forbidden to use this operation. See your administrator",
+            resp.status_code,
         )
         if "error_messages" in json_response:
-            print(json_response["error_messages"])
+            LOG.error("%s", json_response["error_messages"])
         return None
     else:
-        print(
-            f"Error {resp.status_code} returned by call to {my_url}, payload: {json.dumps(call_data,indent=4)}"
+        LOG.error(
+            "Error %s returned by call to %s, payload: %s",
+            resp.status_code,
+            my_url,
+            LazyJSON(call_data),
         )
 
 
 def get_sddc_deployments_json(strProdURL, authentication: VMCAuth, orgid):
     myHeader = {"csp-auth-token": authentication.access_token}
     myURL = f"{strProdURL}/api/inventory/{orgid}/core/deployments?filter=type.code,in:vmc-aws&sort=creator.timestamp,desc&include_deleted_resources=true"
-    response = requests.get(myURL, headers=myHeader, timeout=20)
+    response = api_request("GET", myURL, headers=myHeader, timeout=20)
     if response.status_code == 200:
         return response.json()
     else:
@@ -131,9 +136,9 @@ def get_sddc_tasks_json(strProdURL, authentication: VMCAuth, orgid, sddcid, task
     # myURL = f"{strProdURL}/vmc/api/orgs/{orgid}/tasks?$filter=(resource_id eq {sddcid})"
     myURL = f"{strProdURL}/api/operation/{orgid}/core/operations/{task_id}"
     try:
-        response = requests.get(myURL, headers=myHeader, timeout=20)
+        response = api_request("GET", myURL, headers=myHeader, timeout=20)
     except Exception as e:
-        print(f"get_sddc_tasks_json error: {e}")
+        LOG.warning("get_sddc_tasks_json error: %s", e)
         return None
 
     if response.status_code == 200:
@@ -148,9 +153,9 @@ def get_sddc_task_progress_json(
     myHeader = {"csp-auth-token": authentication.access_token}
     myURL = f"{strProdURL}/vmc/api/orgs/{orgid}/tasks/{task_id}"
     try:
-        response = requests.get(myURL, headers=myHeader, timeout=20)
+        response = api_request("GET", myURL, headers=myHeader, timeout=20)
     except Exception as e:
-        print(f"get_sddc_task_progress_json: {e}")
+        LOG.warning("get_sddc_task_progress_json: %s", e)
         return None
 
     if response.status_code == 200:
@@ -159,6 +164,35 @@ def get_sddc_task_progress_json(
         return None
 
 
+# Task IDs per $filter expression, keeping the query string well below URL
+# length limits
+TASK_FILTER_MAX_IDS = 40
+
+
+def list_org_tasks_json(strProdURL, authentication: VMCAuth, orgid, task_ids):
+    """Returns the tasks of an org whose ID is in task_ids, using one
+    filtered list request per TASK_FILTER_MAX_IDS IDs, or None if error"""
+    myHeader = {"csp-auth-token": authentication.access_token}
+    myURL = f"{strProdURL}/vmc/api/orgs/{orgid}/tasks"
+    task_ids = list(task_ids)
+    tasks = []
+    for start in range(0, len(task_ids), TASK_FILTER_MAX_IDS):
+        chunk = task_ids[start : start + TASK_FILTER_MAX_IDS]
+        params = {"$filter": " or ".join(f"(id eq '{task_id}')" for task_id in chunk)}
+        try:
+            response = api_request(
+                "GET", myURL, headers=myHeader, params=params, timeout=20
+            )
+        except Exception as e:
+            LOG.warning("list_org_tasks_json error: %s", e)
+            return None
+        if response.status_code != 200:
+            LOG.error("Listing tasks failed with status code %s", response.status_code)
+            return None
+        tasks.extend(response.json())
+    return tasks
+
+
 def get_sddc_task_details_json(
     strProdURL, authentication: VMCAuth, orgid, sddcid, task_id, retrieve_progress=False
 ) -> dict:
@@ -168,6 +202,9 @@ def get_sddc_task_details_json(
     )
     if json_response_task:
         task_info["state"] = json_response_task["state"]
+        task_info["provider_assigned_id"] = json_response_task.get(
+            "provider_assigned_id"
+        )
         if retrieve_progress:
             if "provider_assigned_id" in json_response_task.keys():
                 json_response_progress = get_sddc_task_progress_json(
@@ -189,143 +226,237 @@ def get_sddc_task_details_json(
         # task_info["sub_phase"] = json_response["state"]["sub_phase"]
         return task_info
     else:
-        print(f"No task details found for task ID {task_id}")
+        LOG.warning("No task details found for task ID %s", task_id)
         return None
 
 
-def check_task_status_v2(strProdURL, authentication: VMCAuth, orgId, sddcId, taskId):
+# VMC task statuses after which the task no longer changes
+VMC_TASK_FINAL_STATUSES = ("FINISHED", "FAILED", "CANCELED")
+
+
+def get_task_status_v2(
+    strProdURL,
+    authentication: VMCAuth,
+    orgId,
+    sddcId,
+    taskId,
+    retrieve_progress=False,
+    provider_assigned_id=None,
+) -> dict:
+    """Returns a dict with the task status ("READY", "FAILED" or "IN_PROGRESS"),
+    the operations phase when it was fetched, the provider_assigned_id of the
+    underlying VMC task and, when retrieve_progress
+    is set and the API reports them, progress_percent and estimated_remaining_minutes.
+
+    Without retrieve_progress a single request to the operations API decides the
+    status. With retrieve_progress and a provider_assigned_id from an earlier poll,
+    the VMC task is polled first and the operations API is only consulted once
+    that task has reached a final status.
+    """
+    task_status = {
+        "status": "IN_PROGRESS",
+        "progress_percent": None,
+        "estimated_remaining_minutes": None,
+        "provider_assigned_id": provider_assigned_id,
+        "phase": None,
+    }
+
+    if retrieve_progress and provider_assigned_id:
+        json_response_progress = get_sddc_task_progress_json(
+            strProdURL, authentication, orgId, sddcId, provider_assigned_id
+        )
+        if json_response_progress:
+            task_status["progress_percent"] = json_response_progress.get(
+                "progress_percent"
+            )
+            task_status["estimated_remaining_minutes"] = json_response_progress.get(
+                "estimated_remaining_minutes"
+            )
+            if json_response_progress.get("status") not in VMC_TASK_FINAL_STATUSES:
+                return task_status
+
     task_details = get_sddc_task_details_json(
-        strProdURL, authentication, orgId, sddcId, taskId, retrieve_progress=True
+        strProdURL,
+        authentication,
+        orgId,
+        sddcId,
+        taskId,
+        retrieve_progress=retrieve_progress and not provider_assigned_id,
     )
 
     if task_details is None:
-        return "IN_PROGRESS"
+        return task_status
+
+    if task_details.get("provider_assigned_id"):
+        task_status["provider_assigned_id"] = task_details["provider_assigned_id"]
+    if "progress_percent" in task_details:
+        task_status["progress_percent"] = task_details["progress_percent"]
+        task_status["estimated_remaining_minutes"] = task_details.get(
+            "estimated_remaining_minutes"
+        )
 
     if "state" not in task_details:
-        return "IN_PROGRESS"
+        return task_status
 
     if "phase" not in task_details["state"]:
-        return "IN_PROGRESS"
+        return task_status
 
     phase = task_details["state"]["phase"]
+    task_status["phase"] = phase
 
     if phase == "FAILED" or phase == "READY":
-        return phase
-    else:
-        return "IN_PROGRESS"
+        task_status["status"] = phase
+    return task_status
 
 
-def wait_for_task_v2(strProdURL, authentication: VMCAuth, orgId, sddcId, task_id):
-    MAX_RETRIEVAL_ATTEMPTS = 10
-    SLEEP_TIME_SECONDS = 30
+def check_task_status_v2(strProdURL, authentication: VMCAuth, orgId, sddcId, taskId):
+    """Returns "READY", "FAILED" or "IN_PROGRESS" using a single request"""
+    return get_task_status_v2(strProdURL, authentication, orgId, sddcId, taskId)[
+        "status"
+    ]
 
-    task_details = get_sddc_task_details_json(
-        strProdURL, authentication, orgId, sddcId, task_id, retrieve_progress=True
-    )
 
-    task_not_ready = True
-    details_ctr = 0
-    while task_not_ready and details_ctr < MAX_RETRIEVAL_ATTEMPTS:
-        if task_details is None:
-            task_not_ready = True
-        elif "state" not in task_details:
-            task_not_ready = True
-        else:
-            task_not_ready = False
-            break
+# Longest wait_for_task_v2 waits by default; SDDC deployments take about two
+# hours
+WAIT_FOR_TASK_TIMEOUT_SECONDS = 4 * 3600
 
-        details_ctr += 1
-        print(
-            f"Attempting to retrieve task ({details_ctr}/{MAX_RETRIEVAL_ATTEMPTS})..."
-        )
-        time.sleep(10)
-        authentication.check_access_token_expiration()
-        task_details = get_sddc_task_details_json(
-            strProdURL, authentication, orgId, sddcId, task_id
-        )
-        print(task_details)
 
-    if not task_details:
-        print("Could not retrieve task details.")
-    else:
-        task_not_ready = True
-        while task_not_ready:
-            if "phase" not in task_details["state"]:
-                print("Waiting for phase to become available...")
-                task_not_ready = True
-            else:
-                task_not_ready = False
-
-            time.sleep(10)
-
-        phase = task_details["state"]["phase"]
-        while phase != "READY" and phase != "FAILED":
-            print(f"{datetime.now()} - {task_details}")
-            authentication.check_access_token_expiration()
-            task_details = get_sddc_task_details_json(
-                strProdURL,
-                authentication,
-                orgId,
-                sddcId,
-                task_id,
-                retrieve_progress=True,
-            )
-            if task_details is None:
-                phase = "CHECK_FAILED"
-            elif "state" not in task_details:
-                phase = "STATE_NOT_FOUND"
-            elif "phase" not in task_details["state"]:
-                phase = "PHASE_NOT_FOUND"
-            else:
-                phase = task_details["state"]["phase"]
+def _task_phase(task_details) -> str:
+    """Operations phase of task_details, or why there is none"""
+    if task_details is None:
+        return "CHECK_FAILED"
+    if "state" not in task_details:
+        return "STATE_NOT_FOUND"
+    if "phase" not in task_details["state"]:
+        return "PHASE_NOT_FOUND"
+    return task_details["state"]["phase"]
 
-            print(f"Pausing for {SLEEP_TIME_SECONDS} seconds")
-            time.sleep(SLEEP_TIME_SECONDS)
 
-        print(f"SDDC ID: {sddcId}")
+def wait_for_task_v2(
+    strProdURL,
+    authentication: VMCAuth,
+    orgId,
+    sddcId,
+    task_id,
+    timeout=WAIT_FOR_TASK_TIMEOUT_SECONDS,
+    cancel: threading.Event = None,
+    interval=10.0,
+    max_interval=60.0,
+) -> PollResult:
+    """Polls the operations API until the task phase is READY or FAILED,
+    timeout seconds have passed or cancel is set. The returned PollResult
+    carries the final phase as its state and the last task details as its
+    value."""
+
+    def fetch():
+        authentication.check_access_token_expiration()
+        return get_sddc_task_details_json(
+            strProdURL, authentication, orgId, sddcId, task_id, retrieve_progress=True
+        )
+
+    def log_phase(task_details):
+        LOG.info("Task %s phase: %s", task_id, _task_phase(task_details))
+        LOG.debug("Task details: %s", task_details)
+
+    result = poll_until(
+        fetch,
+        lambda task_details: _task_phase(task_details) in ("READY", "FAILED"),
+        state=_task_phase,
+        interval=interval,
+        max_interval=max_interval,
+        timeout=timeout,
+        cancel=cancel,
+        on_poll=log_phase,
+    )
+    LOG.info("SDDC ID: %s, %s", sddcId, result)
+    return result
 
 
 def delete_sddc_json(strProdURL, authentication: VMCAuth, orgID, sddcID, force):
-    """Returns task for the delete process, or None if error"""
+    """Returns task for the delete process, or None if error. Raises
+    Throttled on a 429 not waited out"""
     myHeader = {"csp-auth-token": authentication.access_token}
     myURL = f"{strProdURL}/vmc/api/orgs/{orgID}/sddcs/{sddcID}/"
     if force:
         myURL = myURL + "?force=true"
 
-    print(f"DELETE URL: {myURL}")
-    response = requests.delete(myURL, headers=myHeader, timeout=20)
+    invalidate_sddc_cache(strProdURL, orgID, sddcID)
+    response = api_request("DELETE", myURL, headers=myHeader, timeout=20)
+    raise_for_throttling(response)
     json_response = response.json()
-    print(response.status_code)
-    print(json_response)
+    LOG.debug("Delete response: %s", json_response)
     if response.status_code == 202:
-        print("Delete task created. Task ID:")
-        newTask = json_response["id"]
-        print(f"{newTask}")
+        LOG.info("Delete task created. Task ID: %s", json_response["id"])
         return json_response
     elif response.status_code == 400:
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
+            LOG.error("%s", json_response["error_messages"][0])
         else:
-            print("The SDDC is not in a state that is valid for deletion")
+            LOG.error("The SDDC is not in a state that is valid for deletion")
         return None
     elif response.status_code == 401:
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
+            LOG.error("%s", json_response["error_messages"][0])
         else:
-            print("Current user is unauthorized for this operation.")
+            LOG.error("Current user is unauthorized for this operation.")
         return None
     elif response.status_code == 403:
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
-            print("Access not allowed to the operation for the current user")
+            LOG.error("%s", json_response["error_messages"][0])
+            LOG.error("Access not allowed to the operation for the current user")
         return None
     elif response.status_code == 404:
-        print("Cannot find the SDDC with given identifier")
+        LOG.error("Cannot find the SDDC with given identifier")
         return None
     else:
-        print(f"Unexpected response: {response.status_code}")
+        LOG.error("Unexpected response: %s", response.status_code)
         return None
 
+
+def add_remove_hosts_json(
+    strProdURL,
+    authentication: VMCAuth,
+    orgID,
+    sddcID,
+    num_hosts,
+    action,
+    cluster_id=None,
+):
+    """Adds (action="add") or removes (action="remove") num_hosts ESX hosts
+    in cluster_id, or in the primary cluster when cluster_id is None.
+    Returns the task for the operation, or None if error. Raises Throttled
+    on a 429 not waited out"""
+    myHeader = {"csp-auth-token": authentication.access_token}
+    myURL = f"{strProdURL}/vmc/api/orgs/{orgID}/sddcs/{sddcID}/esxs"
+    params = {"action": action}
+    call_data = {"num_hosts": num_hosts}
+    if cluster_id:
+        call_data["cluster_id"] = cluster_id
+
+    invalidate_sddc_cache(strProdURL, orgID, sddcID)
+    response = api_request(
+        "POST", myURL, headers=myHeader, params=params, json=call_data, timeout=20
+    )
+    raise_for_throttling(response)
+    try:
+        json_response = response.json()
+    except Exception:
+        json_response = {}
+    if response.status_code in (200, 201, 202):
+        LOG.info(
+            "ESX %s of %s host(s) started. Task ID: %s",
+            action,
+            num_hosts,
+            json_response.get("id"),
+        )
+        return json_response
+    elif "error_messages" in json_response:
+        LOG.error("%s", json_response["error_messages"][0])
+    else:
+        LOG.error("Unexpected response: %s", response.status_code)
+    return None
+
+
 ################################################################################
 ### Copyright (C) 2019-2022 VMware, Inc.  All rights reserved.
 ### SPDX-License-Identifier: BSD-2-Clause
@@ -333,12 +464,11 @@ def delete_sddc_json(strProdURL, authentication: VMCAuth, orgID, sddcID, force):
 def watch_sddc_task_json(strProdURL, authentication: VMCAuth, orgID, taskid):
     myHeader = {"csp-auth-token": authentication.access_token}
     myURL = f"{strProdURL}/vmc/api/orgs/{orgID}/tasks/{taskid}"
-    response = requests.get(myURL, headers=myHeader, timeout=20)
-    print(f"URL: {myURL}, HEADER: {myHeader}, WATCH response: {response.status_code}")
+    response = api_request("GET", myURL, headers=myHeader, timeout=20)
     try:
         json_response = response.json()
     except Exception as e:
-        print(f"JSON error: {e}")
+        LOG.error("JSON error: %s", e)
         return None
 
     if response.status_code == 200:
@@ -346,23 +476,23 @@ def watch_sddc_task_json(strProdURL, authentication: VMCAuth, orgID, taskid):
         return json_response
     elif response.status_code == 401:
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
+            LOG.error("%s", json_response["error_messages"][0])
         else:
-            print("User is unauthorized for current operation")
+            LOG.error("User is unauthorized for current operation")
         return None
     elif response.status_code == 403:
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
+            LOG.error("%s", json_response["error_messages"][0])
         else:
-            print("User is forbidden from current action")
+            LOG.error("User is forbidden from current action")
         return None
     elif response.status_code == 404:
-        print("Cannot find the task with given identifier")
+        LOG.error("Cannot find the task with given identifier")
         if "error_messages" in json_response:
-            print(json_response["error_messages"][0])
+            LOG.error("%s", json_response["error_messages"][0])
         return None
     else:
-        print("Unexpected error")
+        LOG.error("Unexpected error")
         return None
     return None
 
@@ -399,19 +529,20 @@ def printTask(event_name: str, task) -> None:
 ### SPDX-License-Identifier: BSD-2-Clause
 ################################################################################
 def watchSDDCTask(**kwargs):
-    """watch task and print out status"""
+    """watch task and print out status until it is final, or until the
+    optional timeout (seconds) passes or the optional cancel event is set"""
     strProdURL = kwargs["strProdURL"]
     orgID = kwargs["ORG_ID"]
     authentication = kwargs["authentication"]
     taskID = kwargs["taskID"]
 
-    status = "STARTED"
-    while status != "FINISHED" and status != "FAILED" and status != "CANCELED":
-        json_response = watch_sddc_task_json(strProdURL, authentication, orgID, taskID)
-        status = json_response["status"]
-        if json_response == None:
-            sys.exit(1)
-        # else, print out the task
+    def fetch():
+        authentication.check_access_token_expiration()
+        return watch_sddc_task_json(strProdURL, authentication, orgID, taskID)
+
+    def show(json_response):
+        if json_response is None:
+            return
         task = json_response["id"]
         now_utc = datetime.now(timezone.utc)
         print(
@@ -419,7 +550,17 @@ def watchSDDCTask(**kwargs):
         )
         printTask("Watch Task", json_response)
         print("")
-        time.sleep(5)
-        authentication.check_access_token_expiration()
 
-    return None
+    result = poll_until(
+        fetch,
+        lambda task: task is None or task["status"] in VMC_TASK_FINAL_STATUSES,
+        state=lambda task: None if task is None else task["status"],
+        interval=5.0,
+        max_interval=30.0,
+        timeout=kwargs.get("timeout"),
+        cancel=kwargs.get("cancel"),
+        on_poll=show,
+    )
+    if result.done and result.value is None:
+        sys.exit(1)
+    return result
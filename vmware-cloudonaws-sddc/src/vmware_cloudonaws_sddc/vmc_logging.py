@@ -0,0 +1,120 @@
+## Structured logging for the VMware Cloud on AWS resource provider
+
+import json
+import logging
+import re
+from urllib.parse import urlsplit
+
+# Parent of every logger in the package; its level is set per invocation
+# from the LogLevel type configuration property.
+PACKAGE_LOGGER_NAME = "vmware_cloudonaws_sddc"
+
+LOG_LEVELS = ("ERROR", "WARNING", "INFO", "DEBUG")
+DEFAULT_LOG_LEVEL = "WARNING"
+
+REDACTED = "<redacted>"
+
+# Token values in headers, JSON documents, query strings and model reprs:
+# csp-auth-token, access_token, AccessToken, refresh_token, api_token, ...
+_TOKEN_PATTERN = re.compile(
+    r"(?i)(csp-auth-token|access_?token|refresh_?token|api_?token)"
+    r"(['\"]?\s*[:=]\s*['\"]?)([^'\"&\s,)}]+)"
+)
+
+# Path segments that follow these collection names are identifiers and are
+# replaced by a placeholder, so calls to the same endpoint share a template.
+_PATH_PARAMETERS = {
+    "orgs": "{org}",
+    "inventory": "{org}",
+    "operation": "{org}",
+    "sddcs": "{sddc}",
+    "tasks": "{task}",
+    "operations": "{operation}",
+}
+
+
+def redact(text: str) -> str:
+    """Replaces token values in text"""
+    return _TOKEN_PATTERN.sub(r"\1\2" + REDACTED, text)
+
+
+class RedactingFilter(logging.Filter):
+    """Formats the message of records that are actually emitted and removes
+    tokens from it. Records below the logger level never reach the filter,
+    so their arguments are never formatted."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        record.msg = redact(message)
+        record.args = None
+        return True
+
+
+_redacting_filter = RedactingFilter()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Returns the named logger with token redaction applied"""
+    logger = logging.getLogger(name)
+    if _redacting_filter not in logger.filters:
+        logger.addFilter(_redacting_filter)
+    return logger
+
+
+def set_log_level(level: str = None) -> None:
+    """Sets the level of every logger in the package; None restores the
+    default"""
+    level = (level or DEFAULT_LOG_LEVEL).upper()
+    if level not in LOG_LEVELS:
+        level = DEFAULT_LOG_LEVEL
+    logging.getLogger(PACKAGE_LOGGER_NAME).setLevel(level)
+
+
+def path_template(url: str) -> str:
+    """/vmc/api/orgs/1234/sddcs/5678?x=y -> /vmc/api/orgs/{org}/sddcs/{sddc}"""
+    segments = urlsplit(url).path.split("/")
+    for index in range(1, len(segments)):
+        placeholder = _PATH_PARAMETERS.get(segments[index - 1])
+        if placeholder and segments[index]:
+            segments[index] = placeholder
+    return "/".join(segments)
+
+
+class LazyJSON:
+    """Log argument serialized to JSON only when the record is emitted"""
+
+    __slots__ = ("document",)
+
+    def __init__(self, document):
+        self.document = document
+
+    def __str__(self) -> str:
+        return json.dumps(self.document, default=str)
+
+
+API_LOG = get_logger(PACKAGE_LOGGER_NAME + ".api")
+
+
+def log_api_call(
+    method: str,
+    path: str,
+    status: int = None,
+    latency: float = None,
+    retry_count: int = 0,
+    error: str = None,
+) -> None:
+    """Emits one JSON record at INFO level describing an API call;
+    path is the URL path template (see path_template)"""
+    if not API_LOG.isEnabledFor(logging.INFO):
+        return
+    record = {
+        "event": "api_call",
+        "method": method,
+        "path": path,
+        "status": status,
+        "latency_ms": None if latency is None else round(latency * 1000, 1),
+        "retries": retry_count,
+    }
+    if error:
+        record["error"] = error
+    API_LOG.info("%s", LazyJSON(record))
@@ -0,0 +1,289 @@
+## Per-invocation telemetry of VMware Cloud on AWS and CSP API calls
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+# Upper bounds (milliseconds) of the latency histogram buckets; the last
+# bucket holds everything slower.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+EMF_NAMESPACE = "VMware/CloudOnAWS/SDDC"
+# CloudWatch accepts at most 100 values per metric in one EMF record
+EMF_MAX_VALUES = 100
+# PutMetricData limits: datums per request, distinct values per datum
+PUT_METRIC_DATA_MAX_DATUMS = 1000
+PUT_METRIC_DATA_MAX_VALUES = 150
+# Publishing runs inside the handler invocation, so it must stay short:
+# connect and read timeouts of the single PutMetricData attempt
+PUT_METRIC_DATA_TIMEOUT_SECONDS = 5
+
+# Metrics are written independently of the LogLevel of the package loggers
+METRICS_LOG = logging.getLogger("vmware_cloudonaws_sddc.metrics")
+METRICS_LOG.setLevel(logging.INFO)
+
+
+class EndpointStats:
+    """Counters and latency histogram of one "METHOD /path/template" """
+
+    __slots__ = (
+        "calls",
+        "errors",
+        "retries",
+        "bytes_sent",
+        "bytes_received",
+        "latencies_ms",
+        "histogram",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.latencies_ms = []
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def add(self, status, latency_ms, bytes_sent, bytes_received, retries) -> None:
+        self.calls += 1
+        if status is None or status >= 400:
+            self.errors += 1
+        self.retries += retries or 0
+        self.bytes_sent += bytes_sent
+        self.bytes_received += bytes_received
+        self.latencies_ms.append(latency_ms)
+        self.histogram[bisect.bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "retries": self.retries,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "latency_ms_sum": round(sum(self.latencies_ms), 1),
+            "latency_ms_max": round(max(self.latencies_ms, default=0), 1),
+            "histogram": {
+                _bucket_label(index): count
+                for index, count in enumerate(self.histogram)
+                if count
+            },
+        }
+
+
+def _bucket_label(index: int) -> str:
+    if index < len(LATENCY_BUCKETS_MS):
+        return f"le_{LATENCY_BUCKETS_MS[index]}"
+    return f"gt_{LATENCY_BUCKETS_MS[-1]}"
+
+
+class ApiMetrics:
+    """API call statistics collected since the last reset, per endpoint"""
+
+    def __init__(self):
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def record(
+        self,
+        method: str,
+        path: str,
+        status: int = None,
+        latency: float = 0.0,
+        bytes_sent: int = 0,
+        bytes_received: int = 0,
+        retries: int = 0,
+    ) -> None:
+        endpoint = f"{method} {path}"
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = EndpointStats()
+            stats.add(
+                status, round(latency * 1000, 1), bytes_sent, bytes_received, retries
+            )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._endpoints = {}
+
+    def snapshot(self) -> dict:
+        """{endpoint: counters and histogram} for the calls recorded so far"""
+        with self._lock:
+            return {
+                endpoint: stats.as_dict() for endpoint, stats in self._endpoints.items()
+            }
+
+    def emf_records(self, dimensions: dict) -> list:
+        """One CloudWatch Embedded Metric Format document per endpoint.
+        dimensions (e.g. Action, StackId) are combined with Endpoint;
+        dimensions whose value is None are left out."""
+        dimensions = {k: v for k, v in dimensions.items() if v is not None}
+        dimension_sets = [[name, "Endpoint"] for name in dimensions]
+        timestamp = int(time.time() * 1000)
+        with self._lock:
+            endpoints = [
+                (endpoint, stats.as_dict(), stats.latencies_ms[:EMF_MAX_VALUES])
+                for endpoint, stats in self._endpoints.items()
+            ]
+
+        records = []
+        for endpoint, summary, latencies_ms in endpoints:
+            record = {
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": EMF_NAMESPACE,
+                            "Dimensions": dimension_sets or [["Endpoint"]],
+                            "Metrics": [
+                                {"Name": "Latency", "Unit": "Milliseconds"},
+                                {"Name": "Calls", "Unit": "Count"},
+                                {"Name": "Errors", "Unit": "Count"},
+                                {"Name": "Retries", "Unit": "Count"},
+                                {"Name": "BytesSent", "Unit": "Bytes"},
+                                {"Name": "BytesReceived", "Unit": "Bytes"},
+                            ],
+                        }
+                    ],
+                },
+                "Endpoint": endpoint,
+                "Latency": latencies_ms,
+                "Calls": summary["calls"],
+                "Errors": summary["errors"],
+                "Retries": summary["retries"],
+                "BytesSent": summary["bytes_sent"],
+                "BytesReceived": summary["bytes_received"],
+                "LatencyHistogram": summary["histogram"],
+            }
+            record.update(dimensions)
+            records.append(record)
+        return records
+
+    def metric_data(self, dimensions: dict) -> list:
+        """The same metrics as emf_records, as PutMetricData datums: one per
+        metric, endpoint and dimension set. Latencies are sent as values and
+        counts so that CloudWatch can compute percentiles."""
+        dimensions = {k: v for k, v in dimensions.items() if v is not None}
+        dimension_sets = [[(name, value)] for name, value in dimensions.items()]
+        timestamp = datetime.now(timezone.utc)
+        with self._lock:
+            endpoints = [
+                (endpoint, stats.as_dict(), Counter(stats.latencies_ms))
+                for endpoint, stats in self._endpoints.items()
+            ]
+
+        datums = []
+        for endpoint, summary, latencies_ms in endpoints:
+            latency = {"Unit": "Milliseconds"}
+            if len(latencies_ms) <= PUT_METRIC_DATA_MAX_VALUES:
+                latency["Values"] = list(latencies_ms)
+                latency["Counts"] = [float(n) for n in latencies_ms.values()]
+            else:
+                latency["StatisticValues"] = {
+                    "SampleCount": float(summary["calls"]),
+                    "Sum": summary["latency_ms_sum"],
+                    "Minimum": min(latencies_ms),
+                    "Maximum": summary["latency_ms_max"],
+                }
+            metrics = [
+                ("Latency", latency),
+                ("Calls", {"Unit": "Count", "Value": summary["calls"]}),
+                ("Errors", {"Unit": "Count", "Value": summary["errors"]}),
+                ("Retries", {"Unit": "Count", "Value": summary["retries"]}),
+                ("BytesSent", {"Unit": "Bytes", "Value": summary["bytes_sent"]}),
+                (
+                    "BytesReceived",
+                    {"Unit": "Bytes", "Value": summary["bytes_received"]},
+                ),
+            ]
+            for dimension_set in dimension_sets or [[]]:
+                datum_dimensions = [
+                    {"Name": name, "Value": str(value)}
+                    for name, value in dimension_set + [("Endpoint", endpoint)]
+                ]
+                for name, values in metrics:
+                    datums.append(
+                        dict(
+                            values,
+                            MetricName=name,
+                            Dimensions=datum_dimensions,
+                            Timestamp=timestamp,
+                        )
+                    )
+        return datums
+
+
+_api_metrics = ApiMetrics()
+
+# Session whose credentials PutMetricData is called with, see
+# set_metrics_session()
+_metrics_session = None
+
+
+def get_api_metrics() -> ApiMetrics:
+    return _api_metrics
+
+
+def set_metrics_session(session) -> None:
+    """Makes emit_api_metrics publish through session, the provider session
+    CloudFormation passes with the type's logging configuration. Records
+    written to the provider log group are not read as EMF, so without a
+    session the metrics are only written as EMF log lines (for local runs).
+    None removes it."""
+    global _metrics_session
+    _metrics_session = session
+
+
+def emit_api_metrics(dimensions: dict, time_limit: float = None) -> None:
+    """Publishes the collected statistics and resets them: in batched
+    PutMetricData calls when a metrics session is set, as EMF log lines
+    otherwise. Failing to publish is logged and never raised.
+    The calls are not retried and take time_limit seconds at most, when
+    given, and a batch is not sent once it has passed."""
+    session = _metrics_session
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+    try:
+        if session is None:
+            for record in _api_metrics.emf_records(dimensions):
+                METRICS_LOG.info(json.dumps(record, separators=(",", ":")))
+            return
+        datums = _api_metrics.metric_data(dimensions)
+        if not datums:
+            return
+        # botocore is loaded with the provider session; imported here so
+        # that invocations without one never pay for it
+        from botocore.config import Config
+
+        timeout = PUT_METRIC_DATA_TIMEOUT_SECONDS
+        if time_limit is not None:
+            # a call may spend its timeout connecting and again reading
+            timeout = min(timeout, time_limit / 2)
+        client = session.client(
+            "cloudwatch",
+            config=Config(
+                connect_timeout=timeout,
+                read_timeout=timeout,
+                retries={"total_max_attempts": 1},
+            ),
+        )
+        for start in range(0, len(datums), PUT_METRIC_DATA_MAX_DATUMS):
+            if deadline is not None and time.monotonic() >= deadline:
+                METRICS_LOG.warning(
+                    "Out of time, %d API metric datums not published",
+                    len(datums) - start,
+                )
+                break
+            client.put_metric_data(
+                Namespace=EMF_NAMESPACE,
+                MetricData=datums[start : start + PUT_METRIC_DATA_MAX_DATUMS],
+            )
+    except Exception as e:
+        METRICS_LOG.warning("Could not publish API metrics: %s", e)
+    finally:
+        _api_metrics.reset()
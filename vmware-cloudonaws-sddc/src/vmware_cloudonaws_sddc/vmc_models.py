@@ -0,0 +1,72 @@
+## Faster deserialization of the generated models
+
+# models.py is generated by `cfn generate` and must not be edited by hand.
+# Its ResourceModel._deserialize scans the module for dataclasses on every
+# call, and TypeConfigurationModel._deserialize does not recast at all, so
+# type configuration values arrive as the strings CloudFormation sends.
+# install_model_deserializers() replaces both with a _deserialize that:
+#   - skips recast_object when every value already has the exact type of
+#     its field (callback contexts, models built by the handlers),
+#   - otherwise calls recast_object with a dataclass table built once.
+# It is installed by the handlers module, and survives regenerating
+# models.py as long as the models only have primitive fields.
+
+from inspect import getmembers, isclass
+from typing import Any, Mapping, Optional, Type, get_args
+
+from cloudformation_cli_python_lib.interface import BaseModel
+from cloudformation_cli_python_lib.recast import recast_object
+
+from . import models
+
+PRIMITIVE_TYPES = (str, int, float, bool)
+
+# _deserialize of each model as generated, kept for comparison
+GENERATED_DESERIALIZERS = {}
+
+
+def _primitive_field_types(cls: Type[BaseModel]) -> Mapping[str, type]:
+    """{field name: type} for the Optional[str/int/float/bool] fields of a model"""
+    field_types = {}
+    for name, field in cls.__dataclass_fields__.items():
+        args = [arg for arg in get_args(field.type) if arg is not type(None)]
+        if len(args) == 1 and args[0] in PRIMITIVE_TYPES:
+            field_types[name] = args[0]
+    return field_types
+
+
+def _is_recast(json_data: Mapping[str, Any], field_types: Mapping[str, type]) -> bool:
+    """True when every value already has the exact type of its field, in which
+    case recast_object would leave json_data unchanged"""
+    for key, value in json_data.items():
+        if type(value) is not field_types.get(key):
+            return False
+    return True
+
+
+def _fast_deserializer(field_types: Mapping[str, type], dataclasses: Mapping):
+    def _deserialize(
+        cls: Type[BaseModel], json_data: Optional[Mapping[str, Any]]
+    ) -> Optional[BaseModel]:
+        if not json_data:
+            return None
+        if not _is_recast(json_data, field_types):
+            recast_object(cls, json_data, dataclasses)
+        return cls(**{name: json_data.get(name) for name in field_types})
+
+    return classmethod(_deserialize)
+
+
+def install_model_deserializers() -> None:
+    """Replaces _deserialize of ResourceModel and TypeConfigurationModel.
+    A model with a field that is not a primitive keeps the generated one,
+    which also deserializes nested models."""
+    dataclasses = {n: o for n, o in getmembers(models) if isclass(o)}
+    for cls in (models.ResourceModel, models.TypeConfigurationModel):
+        if cls in GENERATED_DESERIALIZERS:
+            continue
+        field_types = _primitive_field_types(cls)
+        if len(field_types) != len(cls.__dataclass_fields__):
+            continue
+        GENERATED_DESERIALIZERS[cls] = cls._deserialize
+        cls._deserialize = _fast_deserializer(field_types, dataclasses)
@@ -0,0 +1,98 @@
+## Bounded polling for long-running VMware Cloud on AWS operations
+
+import threading
+import time
+
+from .vmc_logging import get_logger
+
+LOG = get_logger(__name__)
+
+# PollResult.outcome values
+POLL_DONE = "DONE"
+POLL_TIMED_OUT = "TIMED_OUT"
+POLL_CANCELLED = "CANCELLED"
+
+
+class PollResult:
+    """How a poll_until call ended: outcome (POLL_DONE, POLL_TIMED_OUT or
+    POLL_CANCELLED), the state and value of the last poll, the seconds
+    elapsed and the number of polls made"""
+
+    __slots__ = ("outcome", "state", "value", "elapsed", "polls")
+
+    def __init__(self, outcome, state, value, elapsed, polls):
+        self.outcome = outcome
+        self.state = state
+        self.value = value
+        self.elapsed = elapsed
+        self.polls = polls
+
+    @property
+    def done(self) -> bool:
+        return self.outcome == POLL_DONE
+
+    def __repr__(self) -> str:
+        return (
+            f"PollResult(outcome={self.outcome!r}, state={self.state!r}, "
+            f"elapsed={self.elapsed:.1f}, polls={self.polls})"
+        )
+
+
+def poll_until(
+    fetch,
+    is_done,
+    state=None,
+    interval=10.0,
+    max_interval=60.0,
+    backoff=1.5,
+    timeout=None,
+    deadline=None,
+    cancel: threading.Event = None,
+    on_poll=None,
+) -> PollResult:
+    """Calls fetch() until is_done(value) is true, the deadline passes or
+    cancel is set, and returns a PollResult.
+
+    The delay between polls starts at interval and is multiplied by backoff
+    up to max_interval, but never runs past the deadline: deadline is a
+    time.monotonic() value, timeout a number of seconds from now, and the
+    earlier of the two applies. state(value) names the state reported in
+    the result (the value itself by default); on_poll(value) is called after
+    every poll. Setting cancel ends the wait immediately, even mid-sleep."""
+    started = time.monotonic()
+    if timeout is not None:
+        deadline = min(deadline or float("inf"), started + timeout)
+    state = state or (lambda value: value)
+
+    delay = interval
+    value = None
+    polls = 0
+    while True:
+        if cancel is not None and cancel.is_set():
+            outcome = POLL_CANCELLED
+            break
+        value = fetch()
+        polls += 1
+        if on_poll is not None:
+            on_poll(value)
+        if is_done(value):
+            outcome = POLL_DONE
+            break
+
+        pause = delay
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                outcome = POLL_TIMED_OUT
+                break
+            pause = min(pause, remaining)
+        LOG.debug("Polling again in %.1f seconds", pause)
+        if cancel is not None:
+            cancel.wait(pause)
+        else:
+            time.sleep(pause)
+        delay = min(delay * backoff, max_interval)
+
+    result = PollResult(outcome, state(value), value, time.monotonic() - started, polls)
+    LOG.debug("%s", result)
+    return result
@@ -0,0 +1,91 @@
+## Client-side rate limiting of VMware Cloud on AWS API calls per organization
+
+import threading
+import time
+
+# Default sustained request rate allowed per organization
+DEFAULT_REQUESTS_PER_SECOND = 10.0
+
+
+class InMemoryRateLimitBackend:
+    """Token buckets held in this process only"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, key: str, rate: float, burst: float) -> float:
+        """Takes one token from the bucket for key and returns the number of
+        seconds the caller has to wait before the token becomes valid"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated) * rate) - 1
+            self._buckets[key] = (tokens, now)
+        return max(0.0, -tokens / rate)
+
+
+class SQLiteRateLimitBackend:
+    """Token buckets stored in a SQLite file, shared by every process that
+    opens the same path. Intended for local load tests across processes."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with self._connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL, updated REAL)"
+            )
+
+    def _connect(self):
+        # Imported here so that sqlite3 is not part of the handler cold start
+        import sqlite3
+
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def reserve(self, key: str, rate: float, burst: float) -> float:
+        connection = self._connect()
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = connection.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens, updated = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate) - 1
+            connection.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) "
+                "VALUES (?, ?, ?)",
+                (key, tokens, now),
+            )
+            connection.execute("COMMIT")
+        finally:
+            connection.close()
+        return max(0.0, -tokens / rate)
+
+
+class RateLimiter:
+    """Token bucket per key (an organization ID). A caller that finds the
+    bucket empty still gets a token but sleeps until it would have refilled,
+    so concurrent pollers are spread out instead of failing."""
+
+    def __init__(
+        self,
+        requests_per_second: float = DEFAULT_REQUESTS_PER_SECOND,
+        burst: float = None,
+        backend=None,
+    ):
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.backend = backend or InMemoryRateLimitBackend()
+
+    def acquire(self, key: str) -> float:
+        """Blocks until a request for key may be sent.
+        Returns the number of seconds waited"""
+        if not key or not self.requests_per_second:
+            return 0.0
+        burst = self.burst or max(1.0, self.requests_per_second)
+        delay = self.backend.reserve(key, self.requests_per_second, burst)
+        if delay:
+            time.sleep(delay)
+        return delay
@@ -0,0 +1,432 @@
+## Shared HTTP session for VMware Cloud on AWS and CSP API calls
+
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .vmc_logging import log_api_call, path_template
+from .vmc_metrics import get_api_metrics
+from .vmc_ratelimit import RateLimiter
+
+# Number of distinct hosts (vmc.vmware.com, console.cloud.vmware.com, ...)
+# for which a connection pool is kept.
+POOL_CONNECTIONS = 4
+# Maximum number of keep-alive connections kept per host.
+POOL_MAXSIZE = 10
+
+_session = None
+_session_lock = threading.Lock()
+
+_rate_limiter = RateLimiter()
+
+# Organization ID in VMC API paths: /vmc/api/orgs/{org}/...,
+# /api/inventory/{org}/... and /api/operation/{org}/...
+_ORG_ID_PATTERN = re.compile(r"/(?:orgs|api/inventory|api/operation)/([^/?]+)")
+
+
+def get_session() -> requests.Session:
+    """Returns the process-wide session, creating it on first use.
+    Connections are kept alive so warm Lambda containers reuse TLS sessions
+    across handler invocations."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE
+                )
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def reset_session() -> None:
+    """Closes the shared session; the next call opens a fresh one"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    return _rate_limiter
+
+
+def set_rate_limiter(rate_limiter: RateLimiter) -> None:
+    """Replaces the per-organization limiter applied to every API call,
+    e.g. with one using a SQLiteRateLimitBackend shared between processes"""
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+# Time budget of the current invocation, as a time.monotonic() deadline
+_deadline = None
+
+# Requests are not started with less time than this left in the budget
+MIN_REQUEST_SECONDS = 1.0
+# Nor requests that cannot be repeated (POST, PATCH, DELETE by default) with
+# less than this, or than their timeout when it is shorter
+MIN_UNREPEATABLE_REQUEST_SECONDS = 3.0
+
+
+class TimeBudgetExceeded(requests.exceptions.Timeout):
+    """Raised by api_request instead of starting a request, or another
+    attempt at one, that the remaining time budget leaves no room for, and
+    when a request that is safe to repeat times out because the budget
+    shortened its timeout"""
+
+
+def set_time_budget(seconds: float = None) -> None:
+    """Limits every api_request made from now on, its retries and the waits
+    between them included, to the next seconds. Request timeouts shrink to
+    fit what is left. None removes the limit."""
+    global _deadline
+    _deadline = None if seconds is None else time.monotonic() + seconds
+
+
+def remaining_time_budget() -> float:
+    """Seconds left in the time budget, or None when there is none"""
+    deadline = _deadline
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+
+def _fit_timeout(timeout, min_seconds=MIN_REQUEST_SECONDS):
+    """The request timeout, shortened to the remaining time budget.
+    Raises TimeBudgetExceeded when less than min_seconds are left to start"""
+    remaining = remaining_time_budget()
+    if remaining is None:
+        return timeout
+    if remaining < min_seconds:
+        raise TimeBudgetExceeded(
+            f"{remaining:.1f} seconds left in the time budget, "
+            f"{min_seconds} needed to start a request"
+        )
+    if timeout is None:
+        return remaining
+    if isinstance(timeout, tuple):
+        return tuple(remaining if t is None else min(t, remaining) for t in timeout)
+    return min(timeout, remaining)
+
+
+def _fits_time_budget(delay: float) -> bool:
+    """Whether waiting delay seconds still leaves time for another attempt"""
+    remaining = remaining_time_budget()
+    return remaining is None or remaining - delay >= MIN_REQUEST_SECONDS
+
+
+def _org_id_from_url(url: str) -> str:
+    match = _ORG_ID_PATTERN.search(url)
+    return match.group(1) if match else None
+
+
+class RetryPolicy:
+    """Bounded exponential backoff with full jitter.
+
+    Attempt n (starting at 0) waits a random time between 0 and
+    min(max_delay, base_delay * 2 ** n) seconds. A Retry-After header on the
+    response is honored instead, unless it asks for more than
+    max_retry_after seconds, in which case the response is returned as is.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 4,
+        base_delay: float = 0.5,
+        max_delay: float = 8.0,
+        max_retry_after: float = 30.0,
+        retry_statuses: tuple = (429, 500, 502, 503, 504),
+        retry_exceptions: tuple = (
+            requests.exceptions.ConnectionError,
+            requests.exceptions.Timeout,
+        ),
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+        self.retry_statuses = retry_statuses
+        self.retry_exceptions = retry_exceptions
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+
+# GET requests can safely be repeated on any transient failure.
+IDEMPOTENT_RETRY_POLICY = RetryPolicy()
+# POST/PATCH/DELETE start or change SDDC operations. They are only repeated
+# when the server cannot have acted on them: throttled (429) or the
+# connection was never established.
+NON_IDEMPOTENT_RETRY_POLICY = RetryPolicy(
+    max_attempts=3,
+    retry_statuses=(429,),
+    retry_exceptions=(requests.exceptions.ConnectTimeout,),
+)
+
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class Throttled(requests.exceptions.RequestException):
+    """Raised by raise_for_throttling for a 429 answer that api_request did
+    not wait out. retry_after is the delay the server asked for, or None"""
+
+    def __init__(self, *args, retry_after: float = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.retry_after = retry_after
+
+
+def raise_for_throttling(response: requests.Response) -> None:
+    """Raises Throttled if response is a 429: the server did nothing and the
+    request can be sent again once retry_after seconds have passed"""
+    if response.status_code == 429:
+        retry_after = _retry_after_seconds(response)
+        message = f"{path_template(response.url)} throttled"
+        if retry_after is not None:
+            message += f", retry after {retry_after:.0f} seconds"
+        raise Throttled(message, retry_after=retry_after, response=response)
+
+
+def _retry_after_seconds(response: requests.Response) -> float:
+    """Parses a Retry-After header (delta-seconds or HTTP-date).
+    Returns None if the header is absent or malformed"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+
+class CachedJSONResponse(requests.Response):
+    """200 response rebuilt from the conditional GET cache; json() returns
+    the document parsed when it was first downloaded. The raw body is not
+    kept, so after a 304 content is the (empty) body of the 304."""
+
+    def __init__(self, response: requests.Response, document):
+        super().__init__()
+        self.__dict__.update(response.__dict__)
+        self._document = document
+        self.not_modified = response.status_code == 304
+        if self.not_modified:
+            self.status_code = 200
+            self.reason = "OK"
+
+    def json(self, **kwargs):
+        return self._document
+
+
+# Validators (ETag / Last-Modified) and parsed documents of GET responses,
+# keyed by full URL, used to send conditional requests.
+CONDITIONAL_CACHE_MAX_ENTRIES = 128
+
+_conditional_cache = OrderedDict()
+_conditional_cache_lock = threading.Lock()
+
+
+def clear_conditional_cache() -> None:
+    with _conditional_cache_lock:
+        _conditional_cache.clear()
+
+
+def _send_with_retries(
+    method: str, url: str, retry_policy: RetryPolicy, **kwargs
+) -> requests.Response:
+    org_id = _org_id_from_url(url)
+    timeout = kwargs.pop("timeout", None)
+    # A request that may have been carried out before timing out cannot
+    # simply be sent again, nor its handler invoked again; see below. The
+    # policy tells which requests can: those it resends after a read timeout
+    repeatable = issubclass(
+        requests.exceptions.ReadTimeout, retry_policy.retry_exceptions
+    )
+    min_seconds = MIN_REQUEST_SECONDS
+    if not repeatable:
+        whole = sum(timeout) if isinstance(timeout, tuple) else timeout
+        min_seconds = min(whole or float("inf"), MIN_UNREPEATABLE_REQUEST_SECONDS)
+    attempt = 0
+    while True:
+        last_attempt = attempt + 1 >= retry_policy.max_attempts
+        _rate_limiter.acquire(org_id)
+        # Fitted after the rate limiter's wait, which the budget also pays for
+        request_timeout = _fit_timeout(timeout, min_seconds)
+        try:
+            response = get_session().request(
+                method, url, timeout=request_timeout, **kwargs
+            )
+        except requests.exceptions.Timeout as e:
+            # A timeout the budget shortened, or one that leaves no budget
+            # for anything else, is the budget running out. Handlers are
+            # invoked again on TimeBudgetExceeded, so only when the request
+            # is safe to repeat: it is idempotent or was never sent.
+            remaining = remaining_time_budget()
+            if (
+                remaining is not None
+                and (request_timeout != timeout or remaining < MIN_REQUEST_SECONDS)
+                and (repeatable or isinstance(e, requests.exceptions.ConnectTimeout))
+            ):
+                raise TimeBudgetExceeded(
+                    f"{method} {path_template(url)} timed out, "
+                    f"{remaining:.1f} seconds left in the time budget"
+                ) from e
+            if not isinstance(e, retry_policy.retry_exceptions):
+                raise
+            delay = retry_policy.backoff(attempt)
+            if last_attempt or not _fits_time_budget(delay):
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+        except retry_policy.retry_exceptions:
+            delay = retry_policy.backoff(attempt)
+            if last_attempt or not _fits_time_budget(delay):
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        if last_attempt or response.status_code not in retry_policy.retry_statuses:
+            response.retry_count = attempt
+            return response
+
+        delay = _retry_after_seconds(response)
+        if delay is None:
+            delay = retry_policy.backoff(attempt)
+        elif delay > retry_policy.max_retry_after:
+            response.retry_count = attempt
+            return response
+        if not _fits_time_budget(delay):
+            response.retry_count = attempt
+            return response
+        time.sleep(delay)
+        attempt += 1
+
+
+def _conditional_get(url: str, retry_policy: RetryPolicy, **kwargs):
+    """GET that revalidates a previously seen document. A 304 answer is
+    turned into a 200 CachedJSONResponse carrying the cached document"""
+    cache_key = requests.Request("GET", url, params=kwargs.get("params")).prepare().url
+    with _conditional_cache_lock:
+        entry = _conditional_cache.get(cache_key)
+
+    if entry is not None:
+        headers = dict(kwargs.get("headers") or {})
+        if entry["etag"]:
+            headers["If-None-Match"] = entry["etag"]
+        if entry["last_modified"]:
+            headers["If-Modified-Since"] = entry["last_modified"]
+        kwargs["headers"] = headers
+
+    response = _send_with_retries("GET", url, retry_policy, **kwargs)
+
+    if response.status_code == 304 and entry is not None:
+        with _conditional_cache_lock:
+            if cache_key in _conditional_cache:
+                _conditional_cache.move_to_end(cache_key)
+        cached = CachedJSONResponse(response, entry["document"])
+        cached.retry_count = response.retry_count
+        return cached
+
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if response.status_code != 200 or not (etag or last_modified):
+        return response
+
+    try:
+        document = response.json()
+    except ValueError:
+        return response
+    with _conditional_cache_lock:
+        _conditional_cache[cache_key] = {
+            "etag": etag,
+            "last_modified": last_modified,
+            "document": document,
+        }
+        _conditional_cache.move_to_end(cache_key)
+        while len(_conditional_cache) > CONDITIONAL_CACHE_MAX_ENTRIES:
+            _conditional_cache.popitem(last=False)
+    parsed = CachedJSONResponse(response, document)
+    parsed.retry_count = response.retry_count
+    return parsed
+
+
+def api_request(
+    method: str, url: str, retry_policy: RetryPolicy = None, **kwargs
+) -> requests.Response:
+    """Sends a request through the shared session, retrying transient failures
+    according to retry_policy (by default chosen from the HTTP method).
+    Every attempt first waits for the organization's rate limiter.
+    GET requests are conditional once the URL has returned an ETag or
+    Last-Modified validator; a 304 comes back as a 200 whose json() is the
+    cached document, which callers must not modify.
+    Accepts the same keyword arguments as requests.request. The number of
+    retries made is stored on the returned response as retry_count.
+    Each call is logged as one JSON record by log_api_call and recorded in
+    the invocation's API metrics. Under a time budget (set_time_budget) the
+    timeout is shortened to the time left, retries stop when their wait
+    would exhaust it, and TimeBudgetExceeded is raised rather than starting
+    a request with less than MIN_REQUEST_SECONDS left
+    (MIN_UNREPEATABLE_REQUEST_SECONDS for requests the retry policy does not
+    resend after a read timeout). A request that times out because of the
+    budget raises TimeBudgetExceeded as well when it is safe to repeat or
+    never got sent."""
+    method = method.upper()
+    if retry_policy is None:
+        if method in IDEMPOTENT_METHODS:
+            retry_policy = IDEMPOTENT_RETRY_POLICY
+        else:
+            retry_policy = NON_IDEMPOTENT_RETRY_POLICY
+
+    started = time.monotonic()
+    try:
+        if method == "GET":
+            response = _conditional_get(url, retry_policy, **kwargs)
+        else:
+            response = _send_with_retries(method, url, retry_policy, **kwargs)
+    except requests.exceptions.RequestException as e:
+        _observe_call(method, url, None, time.monotonic() - started, type(e).__name__)
+        raise
+    _observe_call(method, url, response, time.monotonic() - started)
+    return response
+
+
+def _observe_call(
+    method: str,
+    url: str,
+    response: requests.Response,
+    latency: float,
+    error: str = None,
+) -> None:
+    """Logs one api_request call and adds it to the invocation's metrics"""
+    path = path_template(url)
+    status = retries = None
+    bytes_sent = bytes_received = 0
+    if response is not None:
+        status = response.status_code
+        retries = response.retry_count
+        body = response.request.body if response.request is not None else None
+        bytes_sent = len(body) if body else 0
+        if not getattr(response, "not_modified", False):
+            bytes_received = len(response.content or b"")
+    log_api_call(method, path, status, latency, retries, error)
+    get_api_metrics().record(
+        method, path, status, latency, bytes_sent, bytes_received, retries
+    )
@@ -0,0 +1,115 @@
+## Multiplexed watching of VMware Cloud on AWS tasks
+
+# A TaskWatcher polls every task it watches in one org with a single filtered
+# task-list request (vmc_csp.list_org_tasks_json), so the number of calls per
+# poll does not grow with the number of operations in flight. Each waiter gets
+# a concurrent.futures.Future resolved with the task once it reaches a final
+# status; asyncio callers can await it through asyncio.wrap_future.
+
+import threading
+from concurrent.futures import Future
+
+from .vmc_auth import VMCAuth
+from .vmc_csp import VMC_TASK_FINAL_STATUSES, list_org_tasks_json
+from .vmc_logging import get_logger
+from .vmc_poll import PollResult, poll_until
+
+LOG = get_logger(__name__)
+
+DEFAULT_POLL_INTERVAL_SECONDS = 60.0
+
+
+class TaskWatcher:
+    """Watches tasks of one org, one filtered list request per poll"""
+
+    def __init__(
+        self,
+        strProdURL,
+        authentication: VMCAuth,
+        orgID,
+        interval=DEFAULT_POLL_INTERVAL_SECONDS,
+    ):
+        self.strProdURL = strProdURL
+        self.authentication = authentication
+        self.orgID = orgID
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._waiters = {}
+        self._latest = {}
+
+    def watch(self, task_id, callback=None) -> Future:
+        """Adds task_id to the next polls. The returned future is resolved
+        with the task JSON once its status is final; callback, if given, is
+        called with that future. Watching a task twice shares the future."""
+        with self._lock:
+            future = self._waiters.get(task_id)
+            if future is None:
+                future = Future()
+                self._waiters[task_id] = future
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def cancel(self, task_id) -> None:
+        """Stops watching task_id; its future is cancelled"""
+        with self._lock:
+            future = self._waiters.pop(task_id, None)
+        if future is not None:
+            future.cancel()
+
+    @property
+    def pending(self) -> list:
+        """IDs of the tasks still watched"""
+        with self._lock:
+            return list(self._waiters)
+
+    def latest(self, task_id) -> dict:
+        """Task JSON from the last poll that returned task_id, or None"""
+        with self._lock:
+            return self._latest.get(task_id)
+
+    def poll(self) -> int:
+        """Fetches every pending task in one request (or one per
+        TASK_FILTER_MAX_IDS tasks) and resolves the futures of those that
+        have finished. Returns the number of tasks still pending."""
+        task_ids = self.pending
+        if not task_ids:
+            return 0
+
+        self.authentication.check_access_token_expiration()
+        tasks = list_org_tasks_json(
+            self.strProdURL, self.authentication, self.orgID, task_ids
+        )
+        if tasks is None:
+            LOG.warning("Polling %s tasks of org %s failed", len(task_ids), self.orgID)
+            return len(task_ids)
+
+        finished = []
+        with self._lock:
+            for task in tasks:
+                task_id = task.get("id")
+                if task_id not in self._waiters:
+                    continue
+                self._latest[task_id] = task
+                if task.get("status") in VMC_TASK_FINAL_STATUSES:
+                    finished.append((self._waiters.pop(task_id), task))
+            remaining = len(self._waiters)
+
+        # Resolved outside the lock, as done callbacks run synchronously
+        for future, task in finished:
+            LOG.info("Task %s %s", task.get("id"), task.get("status"))
+            future.set_result(task)
+        return remaining
+
+    def run(self, timeout=None, cancel: threading.Event = None) -> PollResult:
+        """Polls every interval seconds until no task is pending, timeout
+        seconds have passed or cancel is set. The result's state is the
+        number of tasks still pending."""
+        return poll_until(
+            self.poll,
+            lambda remaining: remaining == 0,
+            interval=self.interval,
+            backoff=1.0,
+            timeout=timeout,
+            cancel=cancel,
+        )
@@ -3,94 +3,230 @@
 ### SPDX-License-Identifier: BSD-2-Clause
 ################################################################################
 
-import json
-import requests
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from .vmc_logging import get_logger
+from .vmc_session import api_request
+
+LOG = get_logger(__name__)
+
+# SDDC documents fetched by READ, UPDATE and LIST are kept briefly so that
+# drift detection, stack updates and console listings hitting the same SDDC
+# within seconds share one API call. Entries are keyed by the access token
+# (hashed) they were fetched with, so a caller only ever reads documents that
+# its own credentials retrieved.
+SDDC_CACHE_TTL_SECONDS = 15
+SDDC_CACHE_MAX_ENTRIES = 256
+
+_sddc_cache = OrderedDict()
+_sddc_cache_lock = threading.Lock()
+
+
+def _sddc_cache_key(strProdURL, orgID, sddcID, sessiontoken) -> tuple:
+    digest = hashlib.sha256(str(sessiontoken).encode("utf-8")).hexdigest()
+    return (strProdURL, orgID, sddcID, digest)
+
+
+def _sddc_cache_get(strProdURL, orgID, sddcID, sessiontoken):
+    """Returns the cached SDDC document, or None if absent or expired"""
+    key = _sddc_cache_key(strProdURL, orgID, sddcID, sessiontoken)
+    with _sddc_cache_lock:
+        entry = _sddc_cache.get(key)
+        if entry is None:
+            return None
+        expires, sddc = entry
+        if expires <= time.monotonic():
+            del _sddc_cache[key]
+            return None
+        _sddc_cache.move_to_end(key)
+        return sddc
+
+
+def _sddc_cache_put(strProdURL, orgID, sddcID, sessiontoken, sddc) -> None:
+    key = _sddc_cache_key(strProdURL, orgID, sddcID, sessiontoken)
+    with _sddc_cache_lock:
+        _sddc_cache[key] = (time.monotonic() + SDDC_CACHE_TTL_SECONDS, sddc)
+        _sddc_cache.move_to_end(key)
+        while len(_sddc_cache) > SDDC_CACHE_MAX_ENTRIES:
+            _sddc_cache.popitem(last=False)
+
+
+def invalidate_sddc_cache(strProdURL, orgID, sddcID) -> None:
+    """Drops the cached documents of an SDDC that is being changed, whatever
+    token fetched them"""
+    with _sddc_cache_lock:
+        for key in [k for k in _sddc_cache if k[:3] == (strProdURL, orgID, sddcID)]:
+            del _sddc_cache[key]
+
+
+def clear_sddc_cache() -> None:
+    with _sddc_cache_lock:
+        _sddc_cache.clear()
+
+
+class SDDCRecord:
+    """The fields of an SDDC document that LIST reports, kept without the
+    rest of the document"""
+
+    __slots__ = (
+        "id",
+        "name",
+        "org_id",
+        "provider",
+        "region",
+        "vpc_cidr",
+        "vc_url",
+        "nsx_reverse_proxy_url",
+    )
+
+    def __init__(
+        self,
+        id,
+        name,
+        org_id,
+        provider,
+        region,
+        vpc_cidr,
+        vc_url,
+        nsx_reverse_proxy_url,
+    ):
+        self.id = id
+        self.name = name
+        self.org_id = org_id
+        self.provider = provider
+        self.region = region
+        self.vpc_cidr = vpc_cidr
+        self.vc_url = vc_url
+        self.nsx_reverse_proxy_url = nsx_reverse_proxy_url
+
+    def __repr__(self) -> str:
+        return f"SDDCRecord(id={self.id!r}, name={self.name!r})"
+
+    @classmethod
+    def from_json(cls, sddc) -> "SDDCRecord":
+        """Raises KeyError or TypeError if the document lacks a field"""
+        resource_config = sddc["resource_config"]
+        return cls(
+            sddc["id"],
+            sddc["name"],
+            sddc["org_id"],
+            sddc["provider"],
+            resource_config["region"],
+            resource_config["vpc_info"]["vpc_cidr"],
+            resource_config["vc_url"],
+            resource_config["nsx_reverse_proxy_url"],
+        )
 
 
 # In order to use the following function, all the functions in this file will have to be modified to use.
 def vmc_error_handling(fxn_response):
     code = fxn_response.status_code
-    print(f"API call failed with status code {code}.")
+    LOG.error("API call failed with status code %s.", code)
     if code == 400:
-        print(f'Error {code}: "Bad Request"')
-        print("Request was improperly formatted or contained an invalid parameter.")
+        LOG.error('Error %s: "Bad Request"', code)
+        LOG.error("Request was improperly formatted or contained an invalid parameter.")
     elif code == 401:
-        print(f'Error {code}: "The user is not authorized to use the API"')
-        print("It's likely your refresh token is out of date or otherwise incorrect.")
+        LOG.error('Error %s: "The user is not authorized to use the API"', code)
+        LOG.error(
+            "It's likely your refresh token is out of date or otherwise incorrect."
+        )
     elif code == 403:
-        print(f'Error {code}: "The user is forbidden to use the API"')
-        print("The client does not have sufficient privileges to execute the request.")
-        print(
+        LOG.error('Error %s: "The user is forbidden to use the API"', code)
+        LOG.error(
+            "The client does not have sufficient privileges to execute the request."
+        )
+        LOG.error(
             "The API is likely in read-only mode, or a request was made to modify a read-only property."
         )
-        print("It's likely your refresh token does not provide sufficient access.")
+        LOG.error("It's likely your refresh token does not provide sufficient access.")
     elif code == 404:
-        print(f'Error {code}: "Organization with this identifier is not found."')
-        print(
+        LOG.error('Error %s: "Organization with this identifier is not found."', code)
+        LOG.error(
             "Please confirm the ORG ID and SDDC ID entries in your config.ini are correct."
         )
     elif code == 409:
-        print(f'Error {code}: "The request could not be processed due to a conflict"')
-        print(
+        LOG.error(
+            'Error %s: "The request could not be processed due to a conflict"', code
+        )
+        LOG.error(
             "The request can not be performed because it conflicts with configuration on a different entity, or because another client modified the same entity."
         )
-        print(
+        LOG.error(
             "If the conflict arose because of a conflict with a different entity, modify the conflicting configuration. If the problem is due to a concurrent update, re-fetch the resource, apply the desired update, and reissue the request."
         )
     elif code == 429:
-        print(f'Error {code}: "The user has sent too many requests"')
+        LOG.error('Error %s: "The user has sent too many requests"', code)
     elif code == 500:
-        print(
-            f'Error {code}: "An unexpected error has occurred while processing the request"'
+        LOG.error(
+            'Error %s: "An unexpected error has occurred while processing the request"',
+            code,
         )
     elif code == 503:
-        print(f'Error {code}: "Service Unavailable"')
-        print(
+        LOG.error('Error %s: "Service Unavailable"', code)
+        LOG.error(
             "The request can not be performed because the associated resource could not be reached or is temporarily busy. Please confirm the ORG ID and SDDC ID entries in your config.ini are correct."
         )
     elif code == 504:
-        print(f'Error {code}: "Gateway Error"')
-        print(
+        LOG.error('Error %s: "Gateway Error"', code)
+        LOG.error(
             "The request can not be performed because there is a problem with the network path. Check your VPN, etc."
         )
     else:
-        print(f"Error: {code}: Unknown error")
+        LOG.error("Error: %s: Unknown error", code)
     try:
         json_response = fxn_response.json()
         if "message" in json_response:
-            print(json_response["message"])
+            LOG.error("%s", json_response["message"])
     except:
-        print("No additional information in the error response.")
+        LOG.error("No additional information in the error response.")
     return None
 
 
-def get_sddcs_json(strProdURL, orgID, sessiontoken):
-    """Returns list of all SDDCs in an Org via json"""
+def get_sddcs_json(strProdURL, orgID, sessiontoken, include_deleted=False):
+    """Returns list of all SDDCs in an Org via json.
+    DELETED SDDCs are filtered out by the API unless include_deleted is set"""
     myHeader = {"csp-auth-token": sessiontoken}
     myURL = f"{strProdURL}/vmc/api/orgs/{orgID}/sddcs"
-    print(myURL)
-    response = requests.get(myURL, headers=myHeader, timeout=20)
+    params = {"includeDeleted": "true" if include_deleted else "false"}
+    response = api_request("GET", myURL, headers=myHeader, params=params, timeout=20)
     json_response = response.json()
-    print(f"list response {response.status_code}")
     if response.status_code == 200:
+        for sddc in json_response:
+            if sessiontoken and isinstance(sddc, dict) and sddc.get("id"):
+                _sddc_cache_put(strProdURL, orgID, sddc["id"], sessiontoken, sddc)
         return json_response
     else:
         vmc_error_handling(response)
 
 
-def get_sddc_info_json(strProdURL, orgID, sessiontoken, sddcID):
-    """Returns SDDC info in JSON format. Returns None if error"""
+def get_sddc_info_json(strProdURL, orgID, sessiontoken, sddcID, use_cache=True):
+    """Returns SDDC info in JSON format. Returns None if error.
+    A document fetched with the same sessiontoken in the last
+    SDDC_CACHE_TTL_SECONDS is returned from the cache unless use_cache is
+    False; callers must not modify it. Without a sessiontoken the cache is
+    never used."""
+    use_cache = use_cache and bool(sessiontoken)
+    if use_cache:
+        sddc = _sddc_cache_get(strProdURL, orgID, sddcID, sessiontoken)
+        if sddc is not None:
+            return sddc
+
     myHeader = {"csp-auth-token": sessiontoken}
     myURL = f"{strProdURL}/vmc/api/orgs/{orgID}/sddcs/{sddcID}"
-    print(myURL)
-    response = requests.get(myURL, headers=myHeader, timeout=20)
-    print(response.status_code)
+    response = api_request("GET", myURL, headers=myHeader, timeout=20)
     json_response = response.json()
     if response.status_code == 200:
+        if sessiontoken:
+            _sddc_cache_put(strProdURL, orgID, sddcID, sessiontoken, json_response)
         return json_response
     else:
-        print("There was an error. Check the syntax.")
-        print(f"API call failed with status code {response.status_code}. URL: {myURL}.")
-        if "error_messages" in json_response:
-            print(json_response["error_messages"])
+        LOG.error(
+            "Get SDDC %s failed with status code %s: %s",
+            sddcID,
+            response.status_code,
+            json_response.get("error_messages"),
+        )
         return None
@@ -0,0 +1,168 @@
+"""
+Benchmarks the VMware::CloudOnAWS::SDDC handlers against the local VMC
+simulator. Each lifecycle creates, reads, updates, lists and deletes one
+SDDC, following every callback; the report gives, per action, the number of
+invocations, wall-clock time per invocation, HTTP calls and bytes per
+invocation.
+
+    python tools/benchmark.py --lifecycles 10 --latency 0.02
+    python tools/benchmark.py --cold --json
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import statistics
+
+from local_lifecycle import LocalLifecycle
+from vmc_simulator import SimulatedVMC
+from vmware_cloudonaws_sddc import vmc_auth, vmc_session, vmc_vmc
+
+
+class ColdStartLifecycle(LocalLifecycle):
+    """Drops the process-wide token cache, HTTP session, conditional GET
+    cache and SDDC cache before every invocation, as if each one ran in a
+    fresh Lambda container."""
+
+    def invoke(self, *args, **kwargs) -> dict:
+        vmc_auth.clear_token_cache()
+        vmc_session.reset_session()
+        vmc_session.clear_conditional_cache()
+        vmc_vmc.clear_sddc_cache()
+        return super().invoke(*args, **kwargs)
+
+
+def percentile(values, fraction) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def report(invocations, lifecycles) -> dict:
+    """Aggregates invocation records per action"""
+    by_action = {}
+    for invocation in invocations:
+        by_action.setdefault(invocation["action"], []).append(invocation)
+
+    result = {}
+    for action, records in by_action.items():
+        seconds = [record["seconds"] for record in records]
+        result[action] = {
+            "invocations_per_lifecycle": len(records) / lifecycles,
+            "seconds_mean": statistics.mean(seconds),
+            "seconds_p50": percentile(seconds, 0.5),
+            "seconds_p95": percentile(seconds, 0.95),
+            "http_calls_per_invocation": statistics.mean(
+                record["http_calls"] for record in records
+            ),
+            "bytes_per_invocation": statistics.mean(
+                record["bytes"] for record in records
+            ),
+        }
+    result["TOTAL"] = {
+        "invocations_per_lifecycle": len(invocations) / lifecycles,
+        "http_calls_per_lifecycle": sum(r["http_calls"] for r in invocations)
+        / lifecycles,
+        "bytes_per_lifecycle": sum(r["bytes"] for r in invocations) / lifecycles,
+        "seconds_per_lifecycle": sum(r["seconds"] for r in invocations) / lifecycles,
+    }
+    return result
+
+
+def run_benchmark(
+    lifecycles=5,
+    latency=0.0,
+    error_rate=0.0,
+    task_duration=7200.0,
+    cold=False,
+    type_configuration=None,
+    seed=0,
+) -> dict:
+    vmc = SimulatedVMC(
+        latency=latency, error_rate=error_rate, task_duration=task_duration, seed=seed
+    )
+    lifecycle_cls = ColdStartLifecycle if cold else LocalLifecycle
+    lifecycle = lifecycle_cls(vmc, type_configuration=type_configuration)
+    failures = 0
+    # Keep anything the handlers write to stdout out of the report
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            for _ in range(lifecycles):
+                results = lifecycle.run_all()
+                failures += sum(
+                    1
+                    for progress in results.values()
+                    if progress["status"] != "SUCCESS"
+                )
+        finally:
+            lifecycle.close()
+
+    result = report(lifecycle.invocations, lifecycles)
+    result["TOTAL"]["failed_actions"] = failures
+    return result
+
+
+def print_report(result) -> None:
+    header = (
+        f"{'action':<8} {'inv/life':>9} {'mean ms':>9} {'p50 ms':>9} "
+        f"{'p95 ms':>9} {'http/inv':>9} {'bytes/inv':>10}"
+    )
+    print(header)
+    for action, entry in result.items():
+        if action == "TOTAL":
+            continue
+        print(
+            f"{action:<8} {entry['invocations_per_lifecycle']:>9.1f} "
+            f"{entry['seconds_mean'] * 1000:>9.1f} "
+            f"{entry['seconds_p50'] * 1000:>9.1f} "
+            f"{entry['seconds_p95'] * 1000:>9.1f} "
+            f"{entry['http_calls_per_invocation']:>9.2f} "
+            f"{entry['bytes_per_invocation']:>10.0f}"
+        )
+    total = result["TOTAL"]
+    print(
+        f"per lifecycle: {total['invocations_per_lifecycle']:.1f} invocations, "
+        f"{total['http_calls_per_lifecycle']:.1f} HTTP calls, "
+        f"{total['bytes_per_lifecycle']:.0f} bytes, "
+        f"{total['seconds_per_lifecycle']:.3f}s handler time, "
+        f"{total['failed_actions']} failed actions"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--lifecycles", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--task-duration", type=float, default=7200.0)
+    parser.add_argument(
+        "--cold",
+        action="store_true",
+        help="drop token cache and HTTP session before every invocation",
+    )
+    parser.add_argument(
+        "--type-configuration",
+        type=json.loads,
+        default=None,
+        help="JSON type configuration, e.g. '{\"CallbackDelayMaxSeconds\": 60}'",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+
+    result = run_benchmark(
+        lifecycles=args.lifecycles,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        task_duration=args.task_duration,
+        cold=args.cold,
+        type_configuration=args.type_configuration,
+    )
+    if args.json:
+        print(json.dumps(result, indent=4))
+    else:
+        print_report(result)
+
+
+if __name__ == "__main__":
+    main()
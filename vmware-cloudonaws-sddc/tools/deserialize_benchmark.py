@@ -0,0 +1,94 @@
+"""
+Micro-benchmark of ResourceModel._deserialize (as installed by
+vmc_models) over 1,000 models, for payloads as CloudFormation sends them
+(every primitive as a string) and for payloads that already carry the
+right types, next to the generated implementation that scans the module
+for dataclasses on every call.
+
+    python tools/deserialize_benchmark.py --models 1000 --repeat 5
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from vmware_cloudonaws_sddc.models import ResourceModel  # noqa: E402
+from vmware_cloudonaws_sddc.vmc_models import (  # noqa: E402
+    GENERATED_DESERIALIZERS,
+    install_model_deserializers,
+)
+
+
+def typed_payload(index: int) -> dict:
+    return {
+        "Name": f"sddc-{index}",
+        "OrgID": "12a034ff-ab12-1d12-12ab-012c3125abc1",
+        "ID": f"{index:08d}-0000-0000-0000-000000000000",
+        "Region": "us-east-1",
+        "HostType": "i3.metal",
+        "NumHosts": 3,
+        "Provider": "AWS",
+        "ManagementSubnet": "10.2.0.0/23",
+        "ProdURL": "https://vmc.vmware.com",
+        "CSPProdURL": "https://console.cloud.vmware.com",
+        "vCenterURL": f"https://vcenter.sddc-{index}.vmwarevmc.com/",
+    }
+
+
+def string_payload(index: int) -> dict:
+    return {key: str(value) for key, value in typed_payload(index).items()}
+
+
+def measure(function, payloads, repeat) -> float:
+    """Best time, in seconds, to deserialize every payload once"""
+
+    def run():
+        for payload in copy.deepcopy(payloads):
+            function(payload)
+
+    copies = timeit.Timer(lambda: copy.deepcopy(payloads)).repeat(repeat, 1)
+    return max(0.0, min(timeit.Timer(run).repeat(repeat, 1)) - min(copies))
+
+
+def run_benchmark(count=1000, repeat=5) -> dict:
+    install_model_deserializers()
+    generated = GENERATED_DESERIALIZERS[ResourceModel]
+    string_payloads = [string_payload(i) for i in range(count)]
+    typed_payloads = [typed_payload(i) for i in range(count)]
+    return {
+        "models": count,
+        "string_payloads_ms": 1000
+        * measure(ResourceModel._deserialize, string_payloads, repeat),
+        "typed_payloads_ms": 1000
+        * measure(ResourceModel._deserialize, typed_payloads, repeat),
+        "generated_string_payloads_ms": 1000
+        * measure(generated, string_payloads, repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--models", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+
+    result = run_benchmark(count=args.models, repeat=args.repeat)
+    if args.json:
+        print(json.dumps(result, indent=4))
+        return
+    print(f"deserializing {result['models']} models (best of {args.repeat}):")
+    print(f"  string payloads      {result['string_payloads_ms']:8.2f} ms")
+    print(f"  typed payloads       {result['typed_payloads_ms']:8.2f} ms")
+    print(f"  generated, strings   {result['generated_string_payloads_ms']:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
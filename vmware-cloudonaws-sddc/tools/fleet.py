@@ -0,0 +1,378 @@
+"""
+Creates, deletes and reports on many SDDCs, across orgs, from one process.
+Requests are submitted with bounded concurrency; the resulting tasks are then
+watched together by one TaskWatcher per org (vmc_tasks), which makes a single
+filtered task-list request per tick however many tasks it follows, and
+aggregated progress is printed until every task has reached a final status.
+
+    python tools/fleet.py manifest.json --concurrency 5 --interval 60
+
+The manifest is a JSON document using the property names of the
+VMware::CloudOnAWS::SDDC resource. "defaults" apply to every entry:
+
+    {
+        "defaults": {
+            "ProdURL": "https://vmc.vmware.com",
+            "CSPProdURL": "https://console.cloud.vmware.com",
+            "AccessToken": "<refresh token>",
+            "OrgID": "<org ID>",
+            "Region": "us-west-2",
+            "HostType": "i3.metal",
+            "Provider": "AWS"
+        },
+        "sddcs": [
+            {"Action": "create", "Name": "sddc-1", "NumHosts": 1,
+             "ManagementSubnet": "10.2.0.0/23", "VXLANSubnet": "172.16.0.0/24"},
+            {"Action": "delete", "ID": "<SDDC ID>"},
+            {"Action": "status", "ID": "<SDDC ID>"}
+        ]
+    }
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+
+from vmware_cloudonaws_sddc import vmc_async  # noqa: E402
+from vmware_cloudonaws_sddc.vmc_auth import VMCAuth  # noqa: E402
+from vmware_cloudonaws_sddc.vmc_csp import VMC_TASK_FINAL_STATUSES  # noqa: E402
+from vmware_cloudonaws_sddc.vmc_session import Throttled  # noqa: E402
+from vmware_cloudonaws_sddc.vmc_tasks import TaskWatcher  # noqa: E402
+
+ACTIONS = ("create", "delete", "status")
+
+# Seconds to watch tasks for before giving up; SDDC deployments take around
+# two hours
+DEFAULT_TIMEOUT_SECONDS = 4 * 3600
+
+# Final phases of a deployment operation, and the task status they stand for
+# when the operation ended before a VMC task was assigned to it
+OPERATION_FINAL_PHASES = {"READY": "FINISHED", "FAILED": "FAILED"}
+
+
+class FleetOperation:
+    """One manifest entry and the state of the task it started"""
+
+    def __init__(self, entry: dict):
+        self.entry = entry
+        self.action = entry.get("Action", "").lower()
+        self.org_id = entry.get("OrgID")
+        self.prod_url = entry.get("ProdURL")
+        self.sddc_id = entry.get("ID")
+        self.operation_id = None
+        self.task_id = None
+        self.status = "PENDING"
+        self.progress_percent = None
+        self.sddc_state = None
+        self.error = None
+
+    @property
+    def label(self) -> str:
+        return self.entry.get("Name") or self.sddc_id or "?"
+
+    @property
+    def done(self) -> bool:
+        return self.status in VMC_TASK_FINAL_STATUSES or self.status == "REJECTED"
+
+    def as_dict(self) -> dict:
+        return {
+            "action": self.action,
+            "org_id": self.org_id,
+            "sddc": self.label,
+            "sddc_id": self.sddc_id,
+            "task_id": self.task_id,
+            "status": self.status,
+            "progress_percent": self.progress_percent,
+            "sddc_state": self.sddc_state,
+            "error": self.error,
+        }
+
+
+def load_manifest(path) -> list:
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    defaults = manifest.get("defaults", {})
+    operations = []
+    for index, entry in enumerate(manifest.get("sddcs", [])):
+        operation = FleetOperation(dict(defaults, **entry))
+        if operation.action not in ACTIONS:
+            raise ValueError(f"sddcs[{index}]: Action must be one of {ACTIONS}")
+        if not operation.org_id or not operation.prod_url:
+            raise ValueError(f"sddcs[{index}]: OrgID and ProdURL are required")
+        if operation.action != "create" and not operation.sddc_id:
+            raise ValueError(f"sddcs[{index}]: ID is required to {operation.action}")
+        operations.append(operation)
+    return operations
+
+
+class Authenticator:
+    """One VMCAuth per (CSP URL, refresh token) found in the manifest"""
+
+    def __init__(self):
+        self._auths = {}
+
+    def __call__(self, entry: dict) -> VMCAuth:
+        key = (entry.get("CSPProdURL"), entry.get("AccessToken"))
+        authentication = self._auths.get(key)
+        if authentication is None:
+            authentication = VMCAuth(key[0])
+            authentication.getAccessToken(key[1])
+            self._auths[key] = authentication
+        return authentication
+
+    def refresh(self) -> None:
+        for authentication in self._auths.values():
+            authentication.check_access_token_expiration()
+
+
+async def submit(operation: FleetOperation, authenticate: Authenticator) -> None:
+    """Sends the create/delete request, or reads the SDDC for status"""
+    entry = operation.entry
+    authentication = await asyncio.to_thread(authenticate, entry)
+    if authentication.access_token is None:
+        operation.status, operation.error = "REJECTED", "authentication failed"
+        return
+
+    if operation.action == "create":
+        try:
+            json_response = await vmc_async.create_sddc_json_v2(
+                authentication,
+                operation.prod_url,
+                operation.org_id,
+                entry.get("Name"),
+                entry.get("Region"),
+                entry.get("NumHosts"),
+                entry.get("HostType"),
+                entry.get("ManagementSubnet"),
+                False,
+                entry.get("VXLANSubnet"),
+                entry.get("Provider", "AWS"),
+                entry.get("ConnectedAWSAccountID"),
+                entry.get("ConnectedAWSSubnetID"),
+            )
+        except Throttled as e:
+            operation.status, operation.error = "REJECTED", str(e)
+            return
+        if not json_response or "id" not in json_response:
+            operation.status, operation.error = "REJECTED", "create request failed"
+            return
+        operation.operation_id = json_response["id"]
+        operation.sddc_id = json_response.get("resource_id")
+        operation.status = "SUBMITTED"
+
+    elif operation.action == "delete":
+        try:
+            json_response = await vmc_async.delete_sddc_json(
+                operation.prod_url,
+                authentication,
+                operation.org_id,
+                operation.sddc_id,
+                False,
+            )
+        except Throttled as e:
+            operation.status, operation.error = "REJECTED", str(e)
+            return
+        if not json_response or "id" not in json_response:
+            operation.status, operation.error = "REJECTED", "delete request failed"
+            return
+        operation.task_id = json_response["id"]
+        operation.status = json_response.get("status", "SUBMITTED")
+
+    else:
+        sddc = await vmc_async.get_sddc_info_json(
+            operation.prod_url,
+            operation.org_id,
+            authentication.access_token,
+            operation.sddc_id,
+            False,
+        )
+        if sddc is None:
+            operation.status, operation.error = "REJECTED", "SDDC not found"
+            return
+        operation.status = "FINISHED"
+        operation.entry.setdefault("Name", sddc.get("name"))
+        operation.sddc_state = sddc.get("sddc_state")
+
+
+class FleetWatchers:
+    """One TaskWatcher per (ProdURL, OrgID), updating the operations it
+    watches as their tasks progress and finish"""
+
+    def __init__(self, authenticate: Authenticator, interval: float):
+        self.authenticate = authenticate
+        self.interval = interval
+        self._watchers = {}
+        self._watched = []
+
+    def watch(self, operation: FleetOperation) -> None:
+        key = (operation.prod_url, operation.org_id)
+        watcher = self._watchers.get(key)
+        if watcher is None:
+            watcher = TaskWatcher(
+                operation.prod_url,
+                self.authenticate(operation.entry),
+                operation.org_id,
+                self.interval,
+            )
+            self._watchers[key] = watcher
+
+        def finished(future):
+            task = future.result()
+            operation.status = task.get("status")
+            operation.progress_percent = task.get("progress_percent")
+            if operation.status != "FINISHED":
+                operation.error = task.get("error_message")
+
+        watcher.watch(operation.task_id, finished)
+        self._watched.append((watcher, operation))
+
+    async def poll(self) -> None:
+        """One task-list request per org, then progress of running tasks"""
+        await vmc_async.poll_task_watchers(self._watchers.values())
+        for watcher, operation in self._watched:
+            task = watcher.latest(operation.task_id)
+            if task is not None and not operation.done:
+                operation.status = task.get("status")
+                operation.progress_percent = task.get("progress_percent")
+
+
+async def resolve_task_ids(operations, watchers: FleetWatchers) -> None:
+    """Creates return a deployment operation; find the VMC task behind it.
+    An operation that ends before a task is assigned to it settles the
+    entry from its phase"""
+
+    async def resolve(operation):
+        json_response = await vmc_async.get_sddc_tasks_json(
+            operation.prod_url,
+            watchers.authenticate(operation.entry),
+            operation.org_id,
+            operation.sddc_id,
+            operation.operation_id,
+        )
+        if not json_response:
+            return
+        if json_response.get("provider_assigned_id"):
+            operation.task_id = json_response["provider_assigned_id"]
+            watchers.watch(operation)
+            return
+        state = json_response.get("state") or {}
+        status = OPERATION_FINAL_PHASES.get(state.get("phase"))
+        if status is not None:
+            operation.status = status
+            if status == "FAILED":
+                operation.error = (
+                    f"deployment failed before a task was assigned "
+                    f"({state.get('sub_phase') or 'no sub phase'})"
+                )
+
+    await vmc_async.gather_bounded(
+        *(resolve(op) for op in operations if op.operation_id and not op.task_id)
+    )
+
+
+def progress_line(operations) -> str:
+    counts = {}
+    for operation in operations:
+        counts[operation.status] = counts.get(operation.status, 0) + 1
+    running = [op for op in operations if not op.done]
+    percents = [op.progress_percent or 0 for op in running]
+    average = f", {sum(percents) / len(percents):.0f}% avg" if percents else ""
+    done = len(operations) - len(running)
+    statuses = ", ".join(
+        f"{count} {status}" for status, count in sorted(counts.items())
+    )
+    return (
+        f"[{datetime.now():%H:%M:%S}] {done}/{len(operations)} done "
+        f"({statuses}){average}"
+    )
+
+
+async def run_fleet(
+    operations,
+    concurrency=5,
+    interval=60.0,
+    timeout=DEFAULT_TIMEOUT_SECONDS,
+    out=sys.stdout,
+) -> list:
+    authenticate = Authenticator()
+    await vmc_async.gather_bounded(
+        *(submit(operation, authenticate) for operation in operations),
+        limit=concurrency,
+    )
+    print(progress_line(operations), file=out, flush=True)
+
+    watchers = FleetWatchers(authenticate, interval)
+    for operation in operations:
+        if operation.task_id and not operation.done:
+            watchers.watch(operation)
+
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while not all(operation.done for operation in operations):
+        if deadline is not None and time.monotonic() >= deadline:
+            print("Timed out waiting for tasks", file=out, flush=True)
+            break
+        await asyncio.sleep(interval)
+        await asyncio.to_thread(authenticate.refresh)
+        await resolve_task_ids(operations, watchers)
+        await watchers.poll()
+        print(progress_line(operations), file=out, flush=True)
+    return operations
+
+
+def print_summary(operations, out=sys.stdout) -> None:
+    print(f"{'action':<7} {'org':<12} {'sddc':<36} {'status':<10} error", file=out)
+    for operation in operations:
+        print(
+            f"{operation.action:<7} {str(operation.org_id)[:12]:<12} "
+            f"{operation.label[:36]:<36} "
+            f"{operation.sddc_state or operation.status:<10} "
+            f"{operation.error or ''}",
+            file=out,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("manifest", help="path to the JSON manifest")
+    parser.add_argument(
+        "--concurrency", type=int, default=5, help="requests submitted at once"
+    )
+    parser.add_argument(
+        "--interval", type=float, default=60.0, help="seconds between polls"
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=DEFAULT_TIMEOUT_SECONDS,
+        help="stop watching after N seconds (default: %(default)d)",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON results")
+    args = parser.parse_args()
+
+    operations = load_manifest(args.manifest)
+    asyncio.run(
+        run_fleet(
+            operations,
+            concurrency=args.concurrency,
+            interval=args.interval,
+            timeout=args.timeout,
+        )
+    )
+    if args.json:
+        print(json.dumps([operation.as_dict() for operation in operations], indent=4))
+    else:
+        print_summary(operations)
+    if any(operation.status != "FINISHED" for operation in operations):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""
+Measures the cold-start import cost of the Lambda handler module
+(vmware_cloudonaws_sddc.handlers) in fresh interpreters using
+python -X importtime, and shows which top-level packages it goes to.
+
+The estimate for Lambda scales the local median by the CPU share of the
+function's MemorySize in template.yml (1 vCPU at 1769 MB), taking one local
+core as one vCPU. Track it between changes rather than reading it as an
+absolute figure.
+
+    python tools/import_benchmark.py --runs 10
+    python tools/import_benchmark.py --budget-ms 300
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+HANDLER_MODULE = "vmware_cloudonaws_sddc.handlers"
+
+# Lambda allocates one full vCPU at this memory size, proportionally less below
+LAMBDA_FULL_VCPU_MB = 1769
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)")
+
+
+def import_once(module=HANDLER_MODULE) -> dict:
+    """Imports module in a new interpreter; returns its cumulative import
+    time and the self time of every module loaded, in microseconds"""
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        filter(None, [os.path.join(ROOT, "src"), env.get("PYTHONPATH")])
+    )
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total = None
+    self_times = {}
+    for line in completed.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        self_times[name] = self_times.get(name, 0) + int(self_us)
+        if name == module and not indent:
+            total = int(cumulative_us)
+    return {"total_us": total, "self_us": self_times}
+
+
+def template_memory_mb(path=os.path.join(ROOT, "template.yml")) -> int:
+    """MemorySize of the handler function in the SAM template"""
+    with open(path) as template:
+        match = re.search(r"^\s*MemorySize:\s*(\d+)", template.read(), re.M)
+    return int(match.group(1)) if match else 128
+
+
+def run_benchmark(runs=5, module=HANDLER_MODULE, top=10) -> dict:
+    samples = [import_once(module) for _ in range(runs)]
+    totals_ms = [sample["total_us"] / 1000 for sample in samples]
+
+    by_package = {}
+    for sample in samples:
+        for name, self_us in sample["self_us"].items():
+            package = name.split(".")[0]
+            by_package.setdefault(package, []).append(self_us / 1000)
+    packages = sorted(
+        ((package, sum(times) / runs) for package, times in by_package.items()),
+        key=lambda item: item[1],
+        reverse=True,
+    )
+
+    memory_mb = template_memory_mb()
+    median_ms = statistics.median(totals_ms)
+    return {
+        "module": module,
+        "runs": runs,
+        "import_ms_median": median_ms,
+        "import_ms_min": min(totals_ms),
+        "import_ms_max": max(totals_ms),
+        "lambda_memory_mb": memory_mb,
+        "lambda_import_ms_estimate": median_ms
+        * max(1.0, LAMBDA_FULL_VCPU_MB / memory_mb),
+        "top_packages_ms": dict(packages[:top]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--module", default=HANDLER_MODULE)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        default=None,
+        help="exit with status 1 when the local median exceeds this",
+    )
+    parser.add_argument("--json", action="store_true", help="print JSON only")
+    args = parser.parse_args()
+
+    result = run_benchmark(runs=args.runs, module=args.module, top=args.top)
+    if args.json:
+        print(json.dumps(result, indent=4))
+    else:
+        print(
+            f"import {result['module']}: median {result['import_ms_median']:.1f} ms "
+            f"(min {result['import_ms_min']:.1f}, max {result['import_ms_max']:.1f}) "
+            f"over {result['runs']} runs"
+        )
+        print(
+            f"estimated on Lambda at {result['lambda_memory_mb']} MB: "
+            f"{result['lambda_import_ms_estimate']:.0f} ms"
+        )
+        for package, ms in result["top_packages_ms"].items():
+            print(f"  {package:<40} {ms:>8.1f} ms")
+
+    if args.budget_ms is not None and result["import_ms_median"] > args.budget_ms:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+Drives the VMware::CloudOnAWS::SDDC handlers through test_entrypoint against
+the local VMC simulator: create, read, update, list and delete, following
+every callback. The simulator clock is moved forward by the requested
+callbackDelaySeconds, so a multi-hour SDDC lifecycle runs in seconds.
+
+    python tools/local_lifecycle.py --task-duration 7200 --latency 0.01
+
+--lambda-timeout gives every invocation a Lambda context with that many
+seconds to run, so handlers see the same time budget as on Lambda.
+--out-of-time instead checks how handlers give up when every API call is
+slower than that budget: READ and LIST must fail with NetworkFailure, and
+DELETE (new or polling) must ask to be invoked again.
+"""
+
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from vmc_simulator import SimulatedVMC, start_simulator  # noqa: E402
+from vmware_cloudonaws_sddc.handlers import test_entrypoint  # noqa: E402
+
+ORG_ID = "12a034ff-ab12-1d12-12ab-012c3125abc1"
+
+# Mirrors example_inputs/inputs_1_create.json, minus the URLs
+BASE_MODEL = {
+    "AccessToken": "simulator-refresh-token",
+    "OrgID": ORG_ID,
+    "Name": "mySDDC",
+    "ManagementSubnet": "10.2.0.0/23",
+    "VXLANSubnet": "172.16.0.0/24",
+    "Region": "us-east-1",
+    "HostType": "i3.metal",
+    "NumHosts": 1,
+    "Provider": "AWS",
+    "ConnectedAWSAccountID": "a134c59b-42e7-25ce-ebc4-425449c2ea2a",
+    "ConnectedAWSSubnetID": "subnet-01ab23c4de56f78e",
+}
+
+CREDENTIALS = {
+    "accessKeyId": "simulator",
+    "secretAccessKey": "simulator",
+    "sessionToken": "simulator",
+}
+
+# Give up on a lifecycle that keeps asking for callbacks
+MAX_INVOCATIONS = 1000
+
+
+class LocalLambdaContext:
+    """The part of the Lambda context the handlers use: the time left in an
+    invocation that started when the context was created"""
+
+    def __init__(self, timeout_seconds: float):
+        self.deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self) -> int:
+        return max(0, int((self.deadline - time.monotonic()) * 1000))
+
+
+class LocalLifecycle:
+    """Runs handler invocations against a simulator started on localhost."""
+
+    def __init__(
+        self, vmc: SimulatedVMC = None, type_configuration=None, lambda_timeout=None
+    ):
+        self.vmc = vmc or SimulatedVMC()
+        self.server = start_simulator(self.vmc)
+        self.type_configuration = type_configuration
+        self.lambda_timeout = lambda_timeout
+        self.invocations = []
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def model(self, **overrides) -> dict:
+        model = dict(BASE_MODEL, ProdURL=self.server.url, CSPProdURL=self.server.url)
+        model.update(overrides)
+        return model
+
+    def invoke(
+        self, action, desired, previous=None, callback_context=None, next_token=None
+    ) -> dict:
+        """One test_entrypoint call; returns the serialized ProgressEvent"""
+        event = {
+            "credentials": CREDENTIALS,
+            "action": action,
+            "region": "us-east-1",
+            "callbackContext": callback_context,
+            "request": {
+                "clientRequestToken": "local-lifecycle",
+                "logicalResourceIdentifier": "MySDDC",
+                "desiredResourceState": copy.deepcopy(desired),
+                "previousResourceState": copy.deepcopy(previous),
+                "typeConfiguration": self.type_configuration,
+                "nextToken": next_token,
+            },
+        }
+        requests_before = self.vmc.request_count
+        bytes_before = self.vmc.bytes_received + self.vmc.bytes_sent
+        started = time.perf_counter()
+        context = None
+        if self.lambda_timeout is not None:
+            context = LocalLambdaContext(self.lambda_timeout)
+        progress = test_entrypoint(event, context)
+        self.invocations.append(
+            {
+                "action": action,
+                "status": progress["status"],
+                "seconds": time.perf_counter() - started,
+                "callbackDelaySeconds": progress.get("callbackDelaySeconds", 0),
+                "http_calls": self.vmc.request_count - requests_before,
+                "bytes": self.vmc.bytes_received + self.vmc.bytes_sent - bytes_before,
+            }
+        )
+        return progress
+
+    def run(self, action, desired, previous=None) -> dict:
+        """Invokes a handler and follows its callbacks until it stops asking
+        for one; returns the final serialized ProgressEvent"""
+        progress = self.invoke(action, desired, previous)
+        count = 1
+        while progress["status"] == "IN_PROGRESS" and count < MAX_INVOCATIONS:
+            self.vmc.clock.advance(progress.get("callbackDelaySeconds", 0))
+            desired = progress.get("resourceModel", desired)
+            progress = self.invoke(
+                action, desired, previous, progress.get("callbackContext")
+            )
+            count += 1
+        return progress
+
+    def run_all(self) -> dict:
+        """create, read, update (rename, then add a host), list and delete
+        one SDDC"""
+        results = {}
+        created = self.run("CREATE", self.model())
+        results["CREATE"] = created
+        model = created.get("resourceModel")
+        if created["status"] != "SUCCESS" or not model:
+            return results
+
+        results["READ"] = self.run("READ", model)
+        renamed = dict(model, Name=model["Name"] + "-renamed")
+        results["UPDATE"] = self.run("UPDATE", renamed, previous=model)
+        scaled = dict(renamed, NumHosts=renamed["NumHosts"] + 1)
+        results["SCALE"] = self.run("UPDATE", scaled, previous=renamed)
+        results["LIST"] = self.run("LIST", self.model())
+        results["DELETE"] = self.run("DELETE", scaled)
+        return results
+
+    def run_out_of_time(self, lambda_timeout=12.5, latency=3.0) -> dict:
+        """Creates an SDDC and starts deleting it, then invokes READ, LIST,
+        a DELETE callback and a new DELETE once each with lambda_timeout
+        seconds to run and latency seconds per API call, longer than the
+        time budget that leaves. Returns the serialized ProgressEvents and,
+        under "expected", whether each one is what CloudFormation should
+        see: NetworkFailure for READ and LIST, IN_PROGRESS for DELETE."""
+        created = self.run("CREATE", self.model())
+        model = created.get("resourceModel")
+        if created["status"] != "SUCCESS" or not model:
+            return {"CREATE": created}
+        deleting = self.invoke("DELETE", model)
+        other = self.run("CREATE", self.model(Name="out-of-time"))["resourceModel"]
+
+        saved = self.vmc.latency, self.lambda_timeout
+        self.vmc.latency, self.lambda_timeout = latency, lambda_timeout
+        try:
+            results = {
+                "READ": self.invoke("READ", model),
+                "LIST": self.invoke("LIST", self.model()),
+                "DELETE_CALLBACK": self.invoke(
+                    "DELETE",
+                    deleting.get("resourceModel", model),
+                    callback_context=deleting.get("callbackContext"),
+                ),
+                "DELETE": self.invoke("DELETE", other),
+            }
+        finally:
+            self.vmc.latency, self.lambda_timeout = saved
+
+        expected = {}
+        for action, progress in results.items():
+            if action in ("READ", "LIST"):
+                expected[action] = progress.get("errorCode") == "NetworkFailure"
+            else:
+                expected[action] = progress["status"] == "IN_PROGRESS"
+        results["expected"] = expected
+        return results
+
+
+def summarize(invocations) -> dict:
+    """Per-action invocation counts and wall-clock time"""
+    summary = {}
+    for invocation in invocations:
+        entry = summary.setdefault(
+            invocation["action"], {"invocations": 0, "seconds": 0.0}
+        )
+        entry["invocations"] += 1
+        entry["seconds"] += invocation["seconds"]
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--task-duration", type=float, default=7200.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument(
+        "--lambda-timeout",
+        type=float,
+        default=None,
+        help="seconds each invocation may run, as the Lambda Timeout",
+    )
+    parser.add_argument(
+        "--out-of-time",
+        action="store_true",
+        help="check the handlers with API calls slower than their time budget",
+    )
+    args = parser.parse_args()
+
+    lifecycle = LocalLifecycle(
+        SimulatedVMC(
+            latency=args.latency,
+            error_rate=args.error_rate,
+            task_duration=args.task_duration,
+            seed=args.seed,
+        ),
+        lambda_timeout=args.lambda_timeout,
+    )
+    if args.out_of_time:
+        try:
+            results = lifecycle.run_out_of_time(
+                lambda_timeout=args.lambda_timeout or 12.5,
+                latency=max(args.latency, 3.0),
+            )
+        finally:
+            lifecycle.close()
+        expected = results.pop("expected", {})
+        for action, progress in results.items():
+            outcome = "ok" if expected.get(action) else "UNEXPECTED"
+            print(
+                f"{action}: {progress['status']} {progress.get('errorCode') or ''} "
+                f"({outcome})"
+            )
+        if not expected or not all(expected.values()):
+            sys.exit(1)
+        return
+
+    try:
+        results = lifecycle.run_all()
+    finally:
+        lifecycle.close()
+
+    for action, progress in results.items():
+        print(f"{action}: {progress['status']} {progress.get('message', '')}")
+    for action, entry in summarize(lifecycle.invocations).items():
+        print(f"{action}: {entry['invocations']} invocations, {entry['seconds']:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,533 @@
+"""
+Local stand-in for the VMware Cloud on AWS and CSP APIs used by the
+VMware::CloudOnAWS::SDDC handlers, for offline load and latency testing.
+
+Run it standalone:
+
+    python tools/vmc_simulator.py --port 8080 --latency 0.05 --error-rate 0.1
+
+then point ProdURL and CSPProdURL at http://127.0.0.1:8080.
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ACCESS_TOKEN_TTL_SECONDS = 1799
+# Refresh tokens starting with this are refused by the authorize endpoint
+REJECTED_REFRESH_TOKEN_PREFIX = "invalid"
+# SDDCs whose name starts with this fail their deployment before a VMC task
+# is assigned to it: the operation goes FAILED without provider_assigned_id
+UNASSIGNED_FAILURE_NAME_PREFIX = "fail-unassigned"
+
+
+class SimulatedClock:
+    """Wall clock that can be moved forward, so a driver can skip the
+    callback delay requested by a handler instead of sleeping through it."""
+
+    def __init__(self):
+        self._offset = 0.0
+        self._lock = threading.Lock()
+
+    def now(self) -> float:
+        with self._lock:
+            return time.time() + self._offset
+
+    def advance(self, seconds: float) -> None:
+        with self._lock:
+            self._offset += seconds
+
+
+class SimulatedTask:
+    """A VMC task and the operation wrapping it, both driven by the clock."""
+
+    def __init__(self, clock, org_id, task_type, resource_id, duration, fail):
+        self.clock = clock
+        self.id = str(uuid.uuid4())
+        self.operation_id = str(uuid.uuid4())
+        self.org_id = org_id
+        self.task_type = task_type
+        self.resource_id = resource_id
+        self.started = clock.now()
+        self.duration = duration
+        self.fail = fail
+        self.on_finish = None
+        self.unassigned = False
+        self._finished = False
+
+    def remaining_seconds(self) -> float:
+        return max(0.0, self.started + self.duration - self.clock.now())
+
+    def status(self) -> str:
+        if self.remaining_seconds() > 0:
+            return "STARTED"
+        if not self._finished:
+            self._finished = True
+            if self.on_finish and not self.fail:
+                self.on_finish()
+        return "FAILED" if self.fail else "FINISHED"
+
+    def task_json(self) -> dict:
+        status = self.status()
+        remaining = self.remaining_seconds()
+        progress = 100 if not remaining else int(100 * (1 - remaining / self.duration))
+        created = datetime.fromtimestamp(self.started, timezone.utc).isoformat()
+        updated = datetime.fromtimestamp(self.clock.now(), timezone.utc).isoformat()
+        return {
+            "id": self.id,
+            "org_id": self.org_id,
+            "created": created,
+            "updated": updated,
+            "updated_by_user_id": "simulator",
+            "updated_by_user_name": "simulator",
+            "user_id": "simulator",
+            "user_name": "simulator",
+            "version": 1,
+            "status": status,
+            "sub_status": None,
+            "progress_percent": progress,
+            "estimated_remaining_minutes": int(remaining // 60),
+            "resource_type": "sddc",
+            "resource_id": self.resource_id,
+            "task_type": self.task_type,
+            "error_message": "Simulated failure" if status == "FAILED" else None,
+        }
+
+    def operation_json(self) -> dict:
+        if self.unassigned:
+            return {
+                "id": self.operation_id,
+                "type": self.task_type,
+                "resource_id": self.resource_id,
+                "provider_assigned_id": None,
+                "state": {"phase": "FAILED", "sub_phase": "VALIDATION"},
+            }
+        status = self.status()
+        phase = {"STARTED": "RUNNING", "FINISHED": "READY"}.get(status, "FAILED")
+        return {
+            "id": self.operation_id,
+            "type": self.task_type,
+            "resource_id": self.resource_id,
+            "provider_assigned_id": self.id,
+            "state": {"phase": phase, "sub_phase": None},
+        }
+
+
+class SimulatedVMC:
+    """In-memory state of the simulated orgs, SDDCs and tasks."""
+
+    def __init__(
+        self,
+        latency=0.0,
+        error_rate=0.0,
+        error_codes=(429, 500, 503),
+        retry_after=1,
+        task_duration=120.0,
+        task_failure_rate=0.0,
+        seed=None,
+    ):
+        self.clock = SimulatedClock()
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_codes = tuple(error_codes)
+        self.retry_after = retry_after
+        self.task_duration = task_duration
+        self.task_failure_rate = task_failure_rate
+        self.random = random.Random(seed)
+        self.sddcs = {}
+        self.tasks = {}
+        self.operations = {}
+        self.request_count = 0
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.lock = threading.RLock()
+        self.access_tokens = set()
+
+    def _new_task(self, org_id, task_type, resource_id) -> SimulatedTask:
+        fail = self.random.random() < self.task_failure_rate
+        task = SimulatedTask(
+            self.clock, org_id, task_type, resource_id, self.task_duration, fail
+        )
+        self.tasks[task.id] = task
+        self.operations[task.operation_id] = task
+        return task
+
+    def _sddc_json(self, org_id, sddc_id) -> dict:
+        sddc = self.sddcs.get((org_id, sddc_id))
+        if sddc is None:
+            return None
+        if sddc.get("_task") is not None:
+            # Settle the pending task so sddc_state follows the clock
+            sddc["_task"].status()
+        return {k: v for k, v in sddc.items() if not k.startswith("_")}
+
+    def create_sddc(self, org_id, body) -> tuple:
+        config = body.get("config", {})
+        sddc_id = str(uuid.uuid4())
+        task = self._new_task(org_id, "SDDC-PROVISION", sddc_id)
+        host_count = config.get("host_count") or 1
+        esx_hosts = [{"esx_id": str(uuid.uuid4())} for _ in range(host_count)]
+        sddc = {
+            "id": sddc_id,
+            "name": config.get("name"),
+            "org_id": org_id,
+            "sddc_state": "DEPLOYING",
+            "provider": config.get("provider_type", "AWS"),
+            "resource_config": {
+                "sddc_id": sddc_id,
+                "region": config.get("location", {}).get("code"),
+                "vc_url": f"https://vcenter.{sddc_id}.simulator.local/",
+                "nsx_reverse_proxy_url": f"https://nsx.{sddc_id}.simulator.local/",
+                "vpc_info": {
+                    "vpc_cidr": config.get("network_config", {}).get("cidr_block")
+                },
+                "esx_hosts": esx_hosts,
+                "clusters": [
+                    {
+                        "cluster_id": str(uuid.uuid4()),
+                        "cluster_name": "Cluster-1",
+                        "esx_host_list": [host["esx_id"] for host in esx_hosts],
+                    }
+                ],
+            },
+            "_task": task,
+        }
+        self.sddcs[(org_id, sddc_id)] = sddc
+        task.on_finish = lambda: sddc.update(sddc_state="READY")
+        if (config.get("name") or "").startswith(UNASSIGNED_FAILURE_NAME_PREFIX):
+            task.unassigned = True
+            sddc["sddc_state"] = "FAILED"
+        return 202, {
+            "id": task.operation_id,
+            "resource_id": sddc_id,
+            "type": "DEPLOY",
+            "state": {"phase": "RUNNING"},
+        }
+
+    def delete_sddc(self, org_id, sddc_id) -> tuple:
+        sddc = self.sddcs.get((org_id, sddc_id))
+        if sddc is None:
+            return 404, {"error_messages": ["SDDC not found"]}
+        if sddc["sddc_state"] in ("DELETING", "DELETED"):
+            return 400, {"error_messages": ["SDDC is already being deleted"]}
+        sddc["sddc_state"] = "DELETING"
+        task = self._new_task(org_id, "SDDC-DELETE", sddc_id)
+        sddc["_task"] = task
+        task.on_finish = lambda: sddc.update(sddc_state="DELETED")
+        return 202, task.task_json()
+
+    def patch_sddc(self, org_id, sddc_id, body) -> tuple:
+        sddc = self.sddcs.get((org_id, sddc_id))
+        if sddc is None:
+            return 404, {"error_messages": ["SDDC not found"]}
+        if "name" in body:
+            sddc["name"] = body["name"]
+        return 200, self._sddc_json(org_id, sddc_id)
+
+    def add_remove_hosts(self, org_id, sddc_id, action, body) -> tuple:
+        sddc = self.sddcs.get((org_id, sddc_id))
+        if sddc is None:
+            return 404, {"error_messages": ["SDDC not found"]}
+        num_hosts = body.get("num_hosts")
+        if action not in ("add", "remove") or not num_hosts:
+            return 400, {"error_messages": ["action and num_hosts are required"]}
+        resource_config = sddc["resource_config"]
+        clusters = resource_config["clusters"]
+        # Without a cluster_id the primary (first) cluster is resized
+        cluster_id = body.get("cluster_id") or clusters[0]["cluster_id"]
+        cluster = next((c for c in clusters if c["cluster_id"] == cluster_id), None)
+        if cluster is None:
+            return 404, {"error_messages": ["Cluster not found"]}
+        host_list = cluster["esx_host_list"]
+        if action == "remove" and num_hosts >= len(host_list):
+            return 400, {"error_messages": ["Cannot remove every host"]}
+        task_type = "ESX-ADD" if action == "add" else "ESX-DELETE"
+        task = self._new_task(org_id, task_type, sddc_id)
+
+        def finish():
+            if action == "add":
+                added = [str(uuid.uuid4()) for _ in range(num_hosts)]
+                host_list.extend(added)
+                resource_config["esx_hosts"].extend(
+                    {"esx_id": esx_id} for esx_id in added
+                )
+            else:
+                removed = set(host_list[-num_hosts:])
+                del host_list[-num_hosts:]
+                resource_config["esx_hosts"][:] = [
+                    host
+                    for host in resource_config["esx_hosts"]
+                    if host["esx_id"] not in removed
+                ]
+
+        task.on_finish = finish
+        sddc["_task"] = task
+        return 202, task.task_json()
+
+    def list_tasks(self, org_id, task_filter=None) -> list:
+        """Tasks of an org, restricted to the IDs named in an
+        "(id eq 'x') or (id eq 'y')" filter when one is given"""
+        tasks = [task for task in self.tasks.values() if task.org_id == org_id]
+        if task_filter:
+            wanted = set(re.findall(r"id eq '?([^')\s]+)'?", task_filter))
+            tasks = [task for task in tasks if task.id in wanted]
+        return [task.task_json() for task in tasks]
+
+    def deployments(self, org_id) -> dict:
+        content = [
+            {
+                "id": sddc["id"],
+                "name": sddc["name"],
+                "type": {"code": "vmc-aws"},
+                "state": sddc["sddc_state"],
+            }
+            for (org, _), sddc in self.sddcs.items()
+            if org == org_id
+        ]
+        return {"content": content, "total_elements": len(content)}
+
+    def dispatch(self, method, path, query, body) -> tuple:
+        """Returns (status code, JSON document) for a request"""
+        with self.lock:
+            if method == "POST" and path.endswith("/api-tokens/authorize"):
+                api_token = query.get("api_token")
+                if not api_token or api_token.startswith(REJECTED_REFRESH_TOKEN_PREFIX):
+                    return 400, {"message": "invalid_grant: api_token is invalid"}
+                access_token = "sim-" + uuid.uuid4().hex
+                self.access_tokens.add(access_token)
+                return 200, {
+                    "access_token": access_token,
+                    "expires_in": ACCESS_TOKEN_TTL_SECONDS,
+                    "token_type": "bearer",
+                }
+
+            match = re.fullmatch(r"/api/inventory/([^/]+)/vmc-aws/operations", path)
+            if match and method == "POST":
+                return self.create_sddc(match.group(1), body or {})
+
+            match = re.fullmatch(r"/api/inventory/([^/]+)/core/deployments", path)
+            if match and method == "GET":
+                return 200, self.deployments(match.group(1))
+
+            match = re.fullmatch(
+                r"/api/operation/([^/]+)/core/operations/([^/]+)", path
+            )
+            if match and method == "GET":
+                task = self.operations.get(match.group(2))
+                if task is None:
+                    return 404, {"error_messages": ["Operation not found"]}
+                return 200, task.operation_json()
+
+            match = re.fullmatch(r"/vmc/api/orgs/([^/]+)/tasks", path)
+            if match and method == "GET":
+                return 200, self.list_tasks(match.group(1), query.get("$filter"))
+
+            match = re.fullmatch(r"/vmc/api/orgs/([^/]+)/tasks/([^/]+)", path)
+            if match and method == "GET":
+                task = self.tasks.get(match.group(2))
+                if task is None:
+                    return 404, {"error_messages": ["Task not found"]}
+                return 200, task.task_json()
+
+            match = re.fullmatch(r"/vmc/api/orgs/([^/]+)/sddcs", path)
+            if match and method == "GET":
+                org_id = match.group(1)
+                include_deleted = query.get("includeDeleted") == "true"
+                sddcs = [
+                    self._sddc_json(org, sddc_id)
+                    for (org, sddc_id) in list(self.sddcs)
+                    if org == org_id
+                ]
+                return 200, [
+                    sddc
+                    for sddc in sddcs
+                    if include_deleted or sddc["sddc_state"] != "DELETED"
+                ]
+
+            match = re.fullmatch(r"/vmc/api/orgs/([^/]+)/sddcs/([^/]+)/esxs", path)
+            if match and method == "POST":
+                org_id, sddc_id = match.groups()
+                return self.add_remove_hosts(
+                    org_id, sddc_id, query.get("action"), body or {}
+                )
+
+            match = re.fullmatch(r"/vmc/api/orgs/([^/]+)/sddcs/([^/]+)/?", path)
+            if match:
+                org_id, sddc_id = match.groups()
+                if method == "GET":
+                    sddc = self._sddc_json(org_id, sddc_id)
+                    if sddc is None:
+                        return 404, {"error_messages": ["SDDC not found"]}
+                    return 200, sddc
+                if method == "PATCH":
+                    return self.patch_sddc(org_id, sddc_id, body or {})
+                if method == "DELETE":
+                    return self.delete_sddc(org_id, sddc_id)
+
+            return 404, {
+                "error_messages": [f"No simulated endpoint for {method} {path}"]
+            }
+
+
+class SimulatorRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY the
+    # body waits for the client's delayed ACK, about 40 ms per request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _handle(self, method):
+        vmc = self.server.vmc
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw_body) if raw_body else None
+        except ValueError:
+            body = None
+
+        if vmc.latency:
+            time.sleep(vmc.latency)
+
+        headers = {}
+        if vmc.error_rate and vmc.random.random() < vmc.error_rate:
+            status = vmc.random.choice(vmc.error_codes)
+            document = {"error_messages": [f"Simulated error {status}"]}
+            if status == 429:
+                headers["Retry-After"] = str(vmc.retry_after)
+        elif (
+            not url.path.endswith("/api-tokens/authorize")
+            and self.headers.get("csp-auth-token") not in vmc.access_tokens
+        ):
+            status, document = 401, {"error_messages": ["Unauthorized"]}
+        else:
+            status, document = vmc.dispatch(method, url.path, query, body)
+
+        payload = json.dumps(document).encode("utf-8")
+        if method == "GET" and status == 200:
+            headers["ETag"] = '"' + hashlib.sha1(payload).hexdigest() + '"'
+            if self.headers.get("If-None-Match") == headers["ETag"]:
+                status, payload = 304, b""
+        with vmc.lock:
+            vmc.request_count += 1
+            vmc.bytes_received += len(raw_body)
+            vmc.bytes_sent += len(payload)
+        self.send_response(status)
+        if payload:
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+    def do_DELETE(self):
+        self._handle("DELETE")
+
+
+class SimulatorServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, vmc: SimulatedVMC, host="127.0.0.1", port=0):
+        super().__init__((host, port), SimulatorRequestHandler)
+        self.vmc = vmc
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def handle_error(self, request, client_address):
+        # Clients that time out before a slow response is written are
+        # expected, not an error of the simulator
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_simulator(vmc: SimulatedVMC = None, host="127.0.0.1", port=0):
+    """Starts a simulator on a background thread and returns the server.
+    Call shutdown() on the returned server to stop it."""
+    server = SimulatorServer(vmc or SimulatedVMC(), host, port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds added to every response"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of requests answered with an injected error",
+    )
+    parser.add_argument(
+        "--error-codes",
+        default="429,500,503",
+        help="comma separated status codes to inject",
+    )
+    parser.add_argument(
+        "--retry-after",
+        type=int,
+        default=1,
+        help="Retry-After value sent with injected 429s",
+    )
+    parser.add_argument(
+        "--task-duration",
+        type=float,
+        default=120.0,
+        help="seconds a simulated task takes to finish",
+    )
+    parser.add_argument(
+        "--task-failure-rate",
+        type=float,
+        default=0.0,
+        help="fraction of simulated tasks that end FAILED",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    vmc = SimulatedVMC(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_codes=[int(code) for code in args.error_codes.split(",")],
+        retry_after=args.retry_after,
+        task_duration=args.task_duration,
+        task_failure_rate=args.task_failure_rate,
+        seed=args.seed,
+    )
+    server = SimulatorServer(vmc, args.host, args.port)
+    print(f"VMC simulator listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()